@@ -0,0 +1,53 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from chat_client.agent import Agent, AgentContext
+from common.config import Config
+
+def fake_llm():
+    # classify_message, prepare_rag_query and the final answer of the chosen node
+    return FakeListChatModel(responses=["orientation", "What is my task in the Fakten und Dimensionen task", "Answer"])
+
+def parameters():
+    return {"query": "What is my task?", "messages": [], "step": "orientation", "current_document": "Fakten und Dimensionen"}
+
+async def run_turns(turns, cached):
+    agent = Agent()
+    llm = fake_llm()
+    build_time = 0.0
+    start = time.perf_counter()
+    for _ in range(turns):
+        build_start = time.perf_counter()
+        graph = agent.graph if cached else agent.create_graph()
+        build_time += time.perf_counter() - build_start
+        await graph.ainvoke(parameters(), context=AgentContext(llm=llm, tools=[]))
+    total = time.perf_counter() - start
+    return build_time / turns, total / turns
+
+def main():
+    parser = argparse.ArgumentParser(description="Graph build and invoke overhead per agent turn with a fake chat model")
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+    # Keep the benchmark from appending to the logs of real sessions
+    Config.Agent.TURN_LOG_PATH = None
+
+    # The agent prints every routing decision, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        rebuilt = asyncio.run(run_turns(args.turns, cached=False))
+        cached = asyncio.run(run_turns(args.turns, cached=True))
+
+    print(f"{args.turns} turns")
+    print(f"  {'graph compiled every turn':<28} build {rebuilt[0] * 1000:>8.3f} ms, turn {rebuilt[1] * 1000:>8.3f} ms")
+    print(f"  {'graph compiled once':<28} build {cached[0] * 1000:>8.3f} ms, turn {cached[1] * 1000:>8.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import tempfile
+from benchmarks.helpers import SENTENCE_PATTERN, document_name
+from common.config import Config
+
+RESTATEMENT_TYPES = ["concept", "definition", "example", "instruction"]
+
+def restatements(chunks, share):
+    # What the real splitter adds on top of the fake one: further chunks of another type repeating a chunk's sentences
+    from common.fakes import stable_hash
+    extra = []
+    for chunk in chunks:
+        if chunk["type"] == "table" or stable_hash(chunk["text"]) % 100 >= share * 100:
+            continue
+        sentences = [match.group(1) for match in SENTENCE_PATTERN.finditer(chunk["text"])] or [chunk["text"]]
+        kept = sentences[:max(1, len(sentences) * 3 // 4)]
+        extra.append({
+            "type": RESTATEMENT_TYPES[stable_hash(chunk["text"]) % len(RESTATEMENT_TYPES)],
+            "text": "In short: " + " ".join(kept),
+        })
+    return chunks + extra
+
+def load_chunks(args, processor):
+    # {filepath: [chunk]} with the embedding of every chunk, from the index or built offline from --data-dir
+    files = {}
+    if args.offline:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for filepath in sorted(glob.glob(os.path.join(args.data_dir, "**", "*.docx"), recursive=True)):
+                doc_id = os.path.splitext(os.path.basename(filepath))[0]
+                semantic_chunks = restatements(processor.extract_chunks(*processor.load_docx_prose_and_tables(filepath)), args.restate)
+                files[filepath] = processor.chunk_large_items(semantic_chunks, doc_id, filepath)
+        texts = [chunk["text"] for chunks in files.values() for chunk in chunks]
+        embeddings = iter(processor.embedding_function.embed_documents(texts))
+        for chunks in files.values():
+            for chunk in chunks:
+                chunk["embedding"] = next(embeddings)
+        return files
+
+    stored = processor.load_existing_db().get(include=["documents", "metadatas", "embeddings"])
+    for text, metadata, embedding in zip(stored["documents"], stored["metadatas"], stored["embeddings"]):
+        doc_id = (metadata or {}).get("doc_id", "")
+        files.setdefault(doc_id.split(".docx_")[0] + ".docx", []).append(
+            {"id": doc_id, "text": text, "type": (metadata or {}).get("type"), "embedding": list(embedding)}
+        )
+    return files
+
+def deduplicate(processor, files):
+    # The same order and rules as DocumentProcessor.process_directory
+    from server.dedup import NearDuplicateIndex
+    index = NearDuplicateIndex()
+    kept = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for filepath, chunks in sorted(files.items(), key=lambda item: not processor._is_shared(item[0])):
+            kept[filepath], _ = processor.remove_near_duplicates(chunks, filepath, index)
+    return kept
+
+def build_index(processor, files):
+    from langchain_chroma import Chroma
+    db = Chroma(persist_directory=tempfile.mkdtemp(prefix="dedup_eval_db_"), embedding_function=processor.embedding_function)
+    chunks = [chunk for file_chunks in files.values() for chunk in file_chunks]
+    batch_size = db._client.get_max_batch_size()
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        db._collection.add(
+            ids=[str(start + i) for i in range(len(batch))],
+            embeddings=[chunk["embedding"] for chunk in batch],
+            documents=[chunk["text"] for chunk in batch],
+            metadatas=[{"type": chunk["type"], "doc_id": chunk["id"]} for chunk in batch],
+        )
+    return db
+
+def load_questions(args, files):
+    if args.labels:
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            return [{"question": label["question"], "current_document": label["current_document"]} for label in json.load(f)]
+    # The first sentence of every chunk, asked from the chunk's own document
+    questions = []
+    for chunks in files.values():
+        for chunk in chunks:
+            match = SENTENCE_PATTERN.match(chunk["text"].strip())
+            question = " ".join((match.group(1) if match else chunk["text"]).split()[:25])
+            if question:
+                questions.append({"question": question, "current_document": document_name(chunk["id"])})
+    return questions
+
+def search(db, vector):
+    if Config.Server.SEARCH_TYPE == "mmr":
+        return db.max_marginal_relevance_search_by_vector(
+            vector, k=Config.Server.SEARCH_K, fetch_k=Config.Server.SEARCH_FETCH_K, lambda_mult=Config.Server.SEARCH_LAMBDA_MULT
+        )
+    return db.similarity_search_by_vector(vector, k=Config.Server.SEARCH_K)
+
+def measure(db, files, questions, vectors):
+    from chat_client.history import count_tokens
+    from server.dedup import shingles
+    totals = {"context_tokens": 0, "redundant_tokens": 0, "distinct_chunks": 0}
+    for question, vector in zip(questions, vectors):
+        # Same filter as DocumentProcessor.get_chunks_for_step
+        docs = [
+            doc for doc in search(db, vector)
+            if question["current_document"] in doc.metadata.get("doc_id", "") or "materials" in doc.metadata.get("doc_id", "")
+        ]
+        seen = []
+        for doc in docs:
+            tokens = count_tokens(doc.page_content)
+            shingle_set = shingles(doc.page_content)
+            redundant = any(len(shingle_set & other) >= Config.Dedup.THRESHOLD * len(shingle_set) for other in seen)
+            totals["context_tokens"] += tokens
+            totals["redundant_tokens"] += tokens if redundant else 0
+            totals["distinct_chunks"] += not redundant
+            seen.append(shingle_set)
+    chunks = [chunk for file_chunks in files.values() for chunk in file_chunks]
+    return {
+        "chunks": len(chunks),
+        "index_tokens": sum(count_tokens(chunk["text"]) for chunk in chunks),
+        **{name: total / len(questions) for name, total in totals.items()},
+    }
+
+def change(before, after):
+    return f"{(after - before) / before:+.0%}" if before else "n/a"
+
+def main():
+    parser = argparse.ArgumentParser(description="Index size and retrieved prompt tokens with and without near-duplicate chunk removal")
+    parser.add_argument("--db-path", default="./teaching_chroma_db", help="Index to analyse (its chunks are used as stored)")
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--offline", action="store_true", help="Fake models over chunks built from --data-dir instead of --db-path")
+    parser.add_argument("--restate", type=float, default=0.5,
+                        help="Offline: share of chunks the fake splitter repeats as another chunk type, like the real one")
+    parser.add_argument("--labels", help="Questions from a benchmarks/retrieval_eval.py label file instead of chunk sentences")
+    parser.add_argument("--threshold", type=float, default=Config.Dedup.THRESHOLD)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.offline:
+        Config.Providers.BACKEND = "fake"
+    Config.Dedup.ENABLED = True
+    Config.Dedup.THRESHOLD = args.threshold
+    from server.document_processor import DocumentProcessor
+    processor = DocumentProcessor(db_path=args.db_path)
+
+    files = load_chunks(args, processor)
+    kept = deduplicate(processor, files)
+    questions = load_questions(args, files)
+    vectors = [processor.embedding_function.embed_query(question["question"]) for question in questions]
+
+    results = {}
+    for name, chunks in (("without dedup", files), ("with dedup", kept)):
+        results[name] = measure(build_index(processor, chunks), chunks, questions, vectors)
+
+    before, after = results["without dedup"], results["with dedup"]
+    print(f"{len(questions)} questions, {Config.Server.SEARCH_TYPE} k={Config.Server.SEARCH_K}, threshold {args.threshold}")
+    print(f"{'':<15} {'chunks':>7} {'index tokens':>13} {'context tokens/q':>17} {'redundant tokens/q':>19} {'distinct chunks/q':>18}")
+    for name, result in results.items():
+        print(f"{name:<15} {result['chunks']:>7} {result['index_tokens']:>13} {result['context_tokens']:>17.1f} "
+              f"{result['redundant_tokens']:>19.1f} {result['distinct_chunks']:>18.2f}")
+    print(f"{'change':<15} {change(before['chunks'], after['chunks']):>7} {change(before['index_tokens'], after['index_tokens']):>13} "
+          f"{change(before['context_tokens'], after['context_tokens']):>17} "
+          f"{change(before['redundant_tokens'], after['redundant_tokens']):>19} "
+          f"{change(before['distinct_chunks'], after['distinct_chunks']):>18}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"questions": len(questions), "threshold": args.threshold, **results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+import httpx
+from chat_client.event_loop import BackgroundEventLoop
+
+# A student simulation turn runs two coroutines: the simulated student and the agent
+CALLS_PER_TURN = 2
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+def thread_per_call(coro):
+    # The previous run_async_function: a new thread and a new event loop for every call
+    q = Queue()
+
+    def runner():
+        try:
+            q.put(asyncio.run(coro))
+        except BaseException as e:
+            q.put(e)
+
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    result = q.get()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+async def noop():
+    return None
+
+async def request_with_new_client(url):
+    # Without a long-lived loop an HTTP client cannot outlive the call
+    async with httpx.AsyncClient() as client:
+        return (await client.get(url)).status_code
+
+async def request_with_shared_client(loop, url):
+    return (await loop.http_client.get(url)).status_code
+
+def measure(turns, run_turn):
+    run_turn()
+    start = time.perf_counter()
+    for _ in range(turns):
+        run_turn()
+    return (time.perf_counter() - start) / turns
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn overhead of running coroutines from the Streamlit thread")
+    parser.add_argument("--turns", type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    loop = BackgroundEventLoop()
+
+    scenarios = [
+        ("empty coroutine, thread per call",
+         lambda: [thread_per_call(noop()) for _ in range(CALLS_PER_TURN)]),
+        ("empty coroutine, shared loop",
+         lambda: [loop.run(noop()) for _ in range(CALLS_PER_TURN)]),
+        ("HTTP request, thread per call + new client",
+         lambda: [thread_per_call(request_with_new_client(url)) for _ in range(CALLS_PER_TURN)]),
+        ("HTTP request, shared loop + shared client",
+         lambda: [loop.run(request_with_shared_client(loop, url)) for _ in range(CALLS_PER_TURN)]),
+    ]
+
+    print(f"{CALLS_PER_TURN} calls per turn, {args.turns} turns")
+    for name, run_turn in scenarios:
+        print(f"  {name:<45} {measure(args.turns, run_turn) * 1e6:>10.1f} us/turn")
+
+    loop.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
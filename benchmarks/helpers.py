@@ -0,0 +1,29 @@
+import os
+import re
+import time
+import httpx
+from common.config import Config
+
+SENTENCE_PATTERN = re.compile(r"(.+?[.?!])(\s|$)")
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def document_name(doc_id):
+    # doc_id is "<filepath>_<document>_<type>_<i>", see DocumentProcessor.chunk_large_items
+    filepath = doc_id.split(".docx_")[0] + ".docx"
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+def wait_until_ready(base_url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}{Config.Server.READY_PATH}", timeout=5).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    return False
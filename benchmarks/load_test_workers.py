@@ -0,0 +1,92 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import subprocess
+import time
+from benchmarks.helpers import percentile, wait_until_ready
+from chat_client.client import connect_to_server
+from common.config import Config
+
+QUESTIONS = [
+    "What is my task?",
+    "What is a fact table?",
+    "Can you give me an example of a dimension?",
+    "How do facts and dimensions relate to each other?",
+]
+
+async def run_session(url, session_index, calls, document, latencies, errors):
+    try:
+        async with connect_to_server(url) as session:
+            for i in range(calls):
+                start = time.perf_counter()
+                try:
+                    # Distinct per session and call: identical concurrent questions would be coalesced into one computation
+                    result = await session.call_tool("get_task_answer", {
+                        "question": f"{QUESTIONS[i % len(QUESTIONS)]} (session {session_index}, call {i})",
+                        "step": "orientation",
+                        "current_document": document,
+                    })
+                    if result.isError:
+                        errors.append(str(result))
+                except Exception as e:
+                    errors.append(str(e))
+                latencies.append(time.perf_counter() - start)
+    except Exception as e:
+        errors.append(str(e))
+
+async def run_load(url, sessions, calls, document):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_session(url, s, calls, document, latencies, errors) for s in range(sessions)])
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "calls": len(latencies),
+        "errors": len(errors),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure get_task_answer throughput for different worker counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sessions", type=int, default=16, help="Concurrent MCP sessions")
+    parser.add_argument("--calls", type=int, default=10, help="Tool calls per session")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--document", default="Fakten und Dimensionen")
+    parser.add_argument("--ready-timeout", type=int, default=600)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = []
+    for workers in args.workers:
+        print(f"Starting {workers} worker(s)...")
+        supervisor = subprocess.Popen(
+            [sys.executable, "-m", "server.workers", "--workers", str(workers), "--port", str(args.port)],
+            cwd=PROJECT_ROOT,
+        )
+        try:
+            if not wait_until_ready(base_url, args.ready_timeout):
+                print(f"Workers did not become ready within {args.ready_timeout}s")
+                continue
+            result = asyncio.run(run_load(f"{base_url}{Config.Server.SSE_PATH}", args.sessions, args.calls, args.document))
+            results.append((workers, result))
+        finally:
+            supervisor.terminate()
+            supervisor.wait()
+
+    print()
+    print(f"{'workers':>8} {'calls/s':>10} {'p50 (s)':>10} {'p95 (s)':>10} {'calls':>8} {'errors':>8} {'speedup':>8}")
+    baseline = results[0][1]["throughput"] if results else 0.0
+    for workers, result in results:
+        speedup = result["throughput"] / baseline if baseline else 0.0
+        print(f"{workers:>8} {result['throughput']:>10.2f} {result['p50']:>10.3f} "
+              f"{result['p95']:>10.3f} {result['calls']:>8} {result['errors']:>8} {speedup:>8.2f}")
+
+if __name__ == "__main__":
+    main()
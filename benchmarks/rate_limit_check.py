@@ -0,0 +1,182 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import uvicorn
+from langchain_core.messages import HumanMessage, SystemMessage
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from benchmarks.helpers import percentile
+from common import rate_limit
+from common.config import Config
+
+BULK_DOCUMENT = " ".join(["The fact table stores the sales amount per date, product and store."] * 150)
+
+class StubOpenAI:
+    """Local stand-in for the OpenAI chat completions API with its own request and token limits.
+
+    Over the limit, or at random with throttle_rate, it answers 429 with OpenAI's rate limit headers.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, latency, throttle_rate, send_retry_after):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.send_retry_after = send_retry_after
+        # Enforced per second, as the real API quantizes its per-minute limits
+        self.requests = requests_per_minute / 60
+        self.tokens = tokens_per_minute / 60
+        self.refilled = time.monotonic()
+        # (time, tokens) of the answered requests of the last minute, for the remaining-* headers
+        self.window = deque()
+        self.stats = Counter()
+        self.app = Starlette(routes=[Route("/v1/chat/completions", self.chat, methods=["POST"])])
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.refilled = now - self.refilled, now
+        self.requests = min(self.requests_per_minute / 60, self.requests + elapsed * self.requests_per_minute / 60)
+        self.tokens = min(self.tokens_per_minute / 60, self.tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _headers(self):
+        now = time.monotonic()
+        while self.window and self.window[0][0] < now - 60:
+            self.window.popleft()
+        return {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-remaining-requests": str(max(0, self.requests_per_minute - len(self.window))),
+            "x-ratelimit-remaining-tokens": str(max(0, self.tokens_per_minute - sum(tokens for _, tokens in self.window))),
+            "x-ratelimit-reset-requests": f"{max(0.0, 1 - self.requests) * 60 / self.requests_per_minute:.3f}s",
+            "x-ratelimit-reset-tokens": f"{max(0.0, -self.tokens) * 60 / self.tokens_per_minute:.3f}s",
+        }
+
+    async def chat(self, request: Request) -> JSONResponse:
+        body = await request.body()
+        payload = await request.json()
+        prompt_tokens = len(body) // 4
+        self._refill()
+        self.stats["requests"] += 1
+        if self.requests < 1 or self.tokens <= 0 or random.random() < self.throttle_rate:
+            self.stats["throttled"] += 1
+            headers = self._headers()
+            if self.send_retry_after:
+                headers["retry-after"] = "1"
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                                status_code=429, headers=headers)
+        self.requests -= 1
+        self.tokens -= prompt_tokens
+        self.window.append((time.monotonic(), prompt_tokens))
+        await asyncio.sleep(self.latency)
+        self.stats["answered"] += 1
+        completion = "The fact table holds the measures, the dimensions describe them."
+        return JSONResponse({
+            "id": f"chatcmpl-{self.stats['answered']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": completion}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 12, "total_tokens": prompt_tokens + 12},
+        }, headers=self._headers())
+
+def start_stub(stub):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(stub.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="openai-stub", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}/v1"
+
+def run_bulk(llm, calls, threads, results):
+    # Like extract_semantic_chunks during ingestion: synchronous calls from worker threads, bulk priority
+    @rate_limit.priority(rate_limit.BULK)
+    def call(i):
+        start = time.perf_counter()
+        try:
+            llm.invoke([SystemMessage(content="Split the text into semantic chunks."), HumanMessage(content=f"{i} {BULK_DOCUMENT}")])
+            results["bulk"]["latencies"].append(time.perf_counter() - start)
+        except Exception as e:
+            results["bulk"]["errors"][type(e).__name__] += 1
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(call, range(calls)))
+
+async def run_interactive(llm, students, turns, delay, results):
+    await asyncio.sleep(delay)
+
+    async def student(i):
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                await llm.ainvoke([HumanMessage(content=f"Student {i}, turn {turn}: what is a fact table?")])
+                results["interactive"]["latencies"].append(time.perf_counter() - start)
+            except Exception as e:
+                results["interactive"]["errors"][type(e).__name__] += 1
+
+    await asyncio.gather(*[student(i) for i in range(students)])
+
+def main():
+    parser = argparse.ArgumentParser(description="Interactive and bulk OpenAI calls against a local stand-in API that returns 429s")
+    parser.add_argument("--api-rpm", type=int, default=300, help="Requests per minute the stand-in API allows")
+    parser.add_argument("--api-tpm", type=int, default=600000, help="Tokens per minute the stand-in API allows")
+    parser.add_argument("--rpm", type=int, default=None, help="Limiter requests per minute (default: 90%% of --api-rpm)")
+    parser.add_argument("--tpm", type=int, default=None, help="Limiter tokens per minute (default: 90%% of --api-tpm)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Stand-in API seconds per answer")
+    parser.add_argument("--throttle-rate", type=float, default=0.05, help="Share of requests answered 429 regardless of the limits")
+    parser.add_argument("--no-retry-after", action="store_true", help="Send 429s without a retry-after header")
+    parser.add_argument("--bulk", type=int, default=60, help="Bulk (ingestion-like) calls")
+    parser.add_argument("--bulk-threads", type=int, default=8)
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--interactive-delay", type=float, default=1.0, help="Seconds after the bulk start before students start")
+    parser.add_argument("--no-limiter", action="store_true", help="Plain OpenAI clients with their own retries, for comparison")
+    args = parser.parse_args()
+
+    Config.Providers.BACKEND = "openai"
+    Config.RateLimit.ENABLED = not args.no_limiter
+    Config.RateLimit.REQUESTS_PER_MINUTE = args.rpm or int(args.api_rpm * 0.9)
+    Config.RateLimit.TOKENS_PER_MINUTE = args.tpm or int(args.api_tpm * 0.9)
+
+    stub = StubOpenAI(args.api_rpm, args.api_tpm, args.latency, args.throttle_rate, not args.no_retry_after)
+    server, base_url = start_stub(stub)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "stub"
+
+    from common.providers import get_chat_model
+    llm = get_chat_model()
+    results = {name: {"latencies": [], "errors": Counter()} for name in ("bulk", "interactive")}
+
+    start = time.perf_counter()
+    bulk = threading.Thread(target=run_bulk, args=(llm, args.bulk, args.bulk_threads, results))
+    bulk.start()
+    asyncio.run(run_interactive(llm, args.students, args.turns, args.interactive_delay, results))
+    bulk.join()
+    elapsed = time.perf_counter() - start
+    server.should_exit = True
+
+    print(f"{'limiter off' if args.no_limiter else 'limiter on'}: {elapsed:.1f}s, stand-in API saw {stub.stats['requests']} requests, "
+          f"answered {stub.stats['answered']}, throttled {stub.stats['throttled']}")
+    for name, result in results.items():
+        errors = sum(result["errors"].values())
+        print(f"  {name:<12} ok {len(result['latencies']):>4}  failed {errors:>4}  "
+              f"p50 {percentile(result['latencies'], 50):6.2f}s  p95 {percentile(result['latencies'], 95):6.2f}s  {dict(result['errors']) or ''}")
+    if not args.no_limiter:
+        print(f"  limiter      {rate_limit.get_limiter().snapshot()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import shutil
+import subprocess
+import tempfile
+from docx import Document as DocxDocument
+from benchmarks.helpers import wait_until_ready
+from chat_client.client import connect_to_server
+from common.config import Config
+
+DOCUMENT = "Freshness check"
+MARKER = "okapi"
+TEXT = (f"The {MARKER} ledger of the zoo lists every animal transfer between enclosures. "
+        f"Each {MARKER} ledger row names the animal, the source enclosure, the target enclosure and the date.")
+QUESTION = "What does the ledger of the zoo list?"
+
+def document_bytes():
+    doc = DocxDocument()
+    doc.add_paragraph(TEXT)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+async def ask(session):
+    result = await session.call_tool("get_task_answer", {"question": QUESTION, "step": "orientation", "current_document": DOCUMENT})
+    text = " ".join(getattr(content, "text", "") for content in result.content)
+    return not result.isError and MARKER in text.lower(), text
+
+async def check(url, workers):
+    async with contextlib.AsyncExitStack() as stack:
+        # Opened one after another and kept open, the proxy pins each session to a different worker
+        sessions = [await stack.enter_async_context(connect_to_server(url)) for _ in range(workers)]
+        before = [found for found, _ in await asyncio.gather(*[ask(session) for session in sessions])]
+        print(f"Before the upload, sessions answering from the document: {sum(before)} of {workers}")
+
+        result = await sessions[-1].call_tool("ingest_document", {
+            "filename": f"{DOCUMENT}.docx",
+            "folder": "tasks",
+            "content_base64": base64.b64encode(document_bytes()).decode("ascii"),
+        })
+        if result.isError:
+            raise RuntimeError(f"ingest_document failed: {result.content}")
+        print(f"Uploaded {DOCUMENT}.docx through the last session: {result.structuredContent}")
+
+        after = await asyncio.gather(*[ask(session) for session in sessions])
+        for i, (found, text) in enumerate(after):
+            print(f"  session {i}: {'answers from the new document' if found else 'STALE: ' + text[:120]}")
+        return all(found for found, _ in after)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every reader worker answers from a document the writer just ingested")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8150)
+    parser.add_argument("--data-dir", default=os.path.join(PROJECT_ROOT, "data"))
+    parser.add_argument("--offline", action="store_true", help="Fake models (MODEL_PROVIDER=fake) in the workers")
+    parser.add_argument("--ready-timeout", type=int, default=600)
+    args = parser.parse_args()
+
+    # Workers run in a scratch directory with a copy of the data, so the real index and ./data stay untouched
+    workdir = tempfile.mkdtemp(prefix="reader_freshness_")
+    shutil.copytree(args.data_dir, os.path.join(workdir, "data"))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.getenv("PYTHONPATH")])))
+    if args.offline:
+        env["MODEL_PROVIDER"] = "fake"
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    supervisor = subprocess.Popen(
+        [sys.executable, "-m", "server.workers", "--workers", str(args.workers), "--port", str(args.port)],
+        cwd=workdir, env=env,
+    )
+    try:
+        if not wait_until_ready(base_url, args.ready_timeout):
+            raise SystemExit(f"Workers did not become ready within {args.ready_timeout}s")
+        ok = asyncio.run(check(f"{base_url}{Config.Server.SSE_PATH}", args.workers))
+    finally:
+        supervisor.terminate()
+        supervisor.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print("All workers answer from the new document" if ok else "Some workers answer from a stale index")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import contextlib
+import glob
+import io
+import itertools
+import json
+import tempfile
+import time
+from benchmarks.helpers import SENTENCE_PATTERN, document_name, percentile
+from common.config import Config
+
+FILTERS = ["none", "document", "document+types"]
+
+def open_index(args):
+    from langchain_chroma import Chroma
+    from server.document_processor import DocumentProcessor
+
+    if not args.offline:
+        processor = DocumentProcessor(db_path=args.db_path)
+        return processor, processor.load_existing_db()
+
+    # Offline: fake splitter and embeddings over a temporary index built from the data directory
+    Config.Providers.BACKEND = "fake"
+    processor = DocumentProcessor(db_path=tempfile.mkdtemp(prefix="retrieval_eval_db_"))
+    docs = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for filepath in sorted(glob.glob(os.path.join(args.data_dir, "**", "*.docx"), recursive=True)):
+            doc_id = os.path.splitext(os.path.basename(filepath))[0]
+            chunks = processor.extract_chunks(*processor.load_docx_prose_and_tables(filepath))
+            docs.extend(processor.to_langchain_documents(processor.chunk_large_items(chunks, doc_id, filepath)))
+    db = Chroma(persist_directory=processor.db_path, embedding_function=processor.embedding_function)
+    db.add_documents(docs)
+    return processor, db
+
+def create_labels(args):
+    # A starting point: the first sentence of every chunk should retrieve that chunk; edit and extend by hand
+    processor, db = open_index(args)
+    stored = db.get(include=["documents", "metadatas"])
+    labels = []
+    for text, metadata in zip(stored["documents"], stored["metadatas"]):
+        doc_id = metadata.get("doc_id", "")
+        match = SENTENCE_PATTERN.match(text.strip())
+        question = " ".join((match.group(1) if match else text).split()[:25])
+        if not question:
+            continue
+        labels.append({
+            "question": question,
+            "step": "orientation",
+            "current_document": document_name(doc_id),
+            "expected": [doc_id],
+        })
+    labels.sort(key=lambda label: label["expected"][0])
+    with open(args.labels, 'w', encoding='utf-8') as f:
+        json.dump(labels, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {len(labels)} labelled questions to {args.labels}")
+
+def search_configs(args):
+    for k in args.k:
+        yield {"search_type": "similarity", "k": k}
+    for k, fetch_k, lambda_mult in itertools.product(args.k, args.fetch_k, args.lambda_mult):
+        if fetch_k >= k:
+            yield {"search_type": "mmr", "k": k, "fetch_k": fetch_k, "lambda_mult": lambda_mult}
+
+def search(db, vector, config):
+    if config["search_type"] == "mmr":
+        return db.max_marginal_relevance_search_by_vector(
+            vector, k=config["k"], fetch_k=config["fetch_k"], lambda_mult=config["lambda_mult"]
+        )
+    return db.similarity_search_by_vector(vector, k=config["k"])
+
+def apply_filter(processor, docs, name, label):
+    if name == "none":
+        return docs
+    # Same rule as DocumentProcessor.get_chunks_for_step
+    current_document = label["current_document"]
+    docs = [
+        doc for doc in docs
+        if current_document in doc.metadata.get("doc_id", "") or "materials" in doc.metadata.get("doc_id", "")
+    ]
+    if name == "document+types":
+        types = processor.get_chunk_types_for_step(label["step"])
+        docs = [doc for doc in docs if doc.metadata.get("type") in types]
+    return docs
+
+def evaluate(args):
+    with open(args.labels, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+    processor, db = open_index(args)
+
+    # Query embeddings do not depend on the search parameters: embed once, time the searches only
+    embed_start = time.perf_counter()
+    vectors = [processor.embedding_function.embed_query(label["question"]) for label in labels]
+    embed_latency = (time.perf_counter() - embed_start) / len(labels)
+
+    results = []
+    for config in search_configs(args):
+        per_filter = {name: {"recall": [], "reciprocal_ranks": [], "empty": 0, "latencies": []} for name in args.filters}
+        for label, vector in zip(labels, vectors):
+            start = time.perf_counter()
+            docs = search(db, vector, config)
+            search_latency = time.perf_counter() - start
+            expected = set(label["expected"])
+            for name in args.filters:
+                filter_start = time.perf_counter()
+                filtered = apply_filter(processor, docs, name, label)
+                stats = per_filter[name]
+                stats["latencies"].append(search_latency + time.perf_counter() - filter_start)
+                ids = [doc.metadata.get("doc_id") for doc in filtered]
+                stats["empty"] += not ids
+                stats["recall"].append(len(expected & set(ids)) / len(expected) if expected else 0.0)
+                rank = next((i + 1 for i, doc_id in enumerate(ids) if doc_id in expected), None)
+                stats["reciprocal_ranks"].append(1 / rank if rank else 0.0)
+        for name, stats in per_filter.items():
+            results.append({
+                **config,
+                "filter": name,
+                "recall": sum(stats["recall"]) / len(labels),
+                "mrr": sum(stats["reciprocal_ranks"]) / len(labels),
+                "empty_rate": stats["empty"] / len(labels),
+                "p50_ms": percentile(stats["latencies"], 50) * 1000,
+                "p95_ms": percentile(stats["latencies"], 95) * 1000,
+            })
+    return {"questions": len(labels), "embed_ms": embed_latency * 1000, "configs": results}
+
+def describe(result):
+    if result["search_type"] == "mmr":
+        return f"mmr k={result['k']} fetch_k={result['fetch_k']} lambda={result['lambda_mult']}"
+    return f"similarity k={result['k']}"
+
+def report(evaluation, min_recall):
+    print(f"{evaluation['questions']} questions, query embedding {evaluation['embed_ms']:.1f} ms (not included below)")
+    print(f"{'configuration':<40} {'filter':<15} {'recall':>7} {'mrr':>6} {'empty':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for result in evaluation["configs"]:
+        print(f"{describe(result):<40} {result['filter']:<15} {result['recall']:>7.2f} {result['mrr']:>6.2f} "
+              f"{result['empty_rate']:>6.0%} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}")
+    passing = [result for result in evaluation["configs"] if result["recall"] >= min_recall]
+    if passing:
+        best = min(passing, key=lambda result: result["p50_ms"])
+        print(f"\nFastest with recall >= {min_recall:.2f}: {describe(best)}, filter {best['filter']} "
+              f"(recall {best['recall']:.2f}, p50 {best['p50_ms']:.2f} ms)")
+    else:
+        print(f"\nNo configuration reaches recall {min_recall:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency for different search parameters")
+    parser.add_argument("command", choices=["label", "run"], help="label: write a starting label set, run: evaluate")
+    parser.add_argument("--labels", default=os.path.join(PROJECT_ROOT, "benchmarks", "retrieval_labels.json"))
+    parser.add_argument("--db-path", default="./teaching_chroma_db")
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--offline", action="store_true", help="Fake models over a temporary index built from --data-dir")
+    parser.add_argument("--k", type=int, nargs="+", default=[2, 4, 6, 8])
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--lambda-mult", type=float, nargs="+", default=[0.25, 0.5, 0.75, 1.0])
+    parser.add_argument("--filters", nargs="+", choices=FILTERS, default=FILTERS)
+    parser.add_argument("--min-recall", type=float, default=0.8)
+    parser.add_argument("--output", help="Write the evaluation as JSON to this file")
+    args = parser.parse_args()
+
+    if args.command == "label":
+        create_labels(args)
+        return
+
+    evaluation = evaluate(args)
+    report(evaluation, args.min_recall)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(evaluation, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+from collections import Counter
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from benchmarks.helpers import percentile
+from chat_client.agent import Agent
+from chat_client.client import MCPSessionManager
+from chat_client.history import ConversationHistory, render_messages
+from common.config import Config
+from common.fakes import fake_task_answer_tool
+from common.prompts import Prompts
+from common.providers import get_chat_model
+
+FIRST_PROMPT = "Hello, what is my task?"
+
+def task_documents(tasks_dir):
+    # Same task list as the Streamlit sidebar
+    if not os.path.isdir(tasks_dir):
+        return []
+    return sorted(
+        os.path.splitext(f)[0]
+        for f in os.listdir(tasks_dir)
+        if os.path.isfile(os.path.join(tasks_dir, f)) and f.endswith('.docx')
+    )
+
+async def run_student(agent, llm, tools, document, max_turns, start_delay, stats):
+    # One simulated student, following the simulation loop of main_student_simulation_chat.py
+    await asyncio.sleep(start_delay)
+    messages = []
+    history = ConversationHistory()
+    step = "orientation"
+    prompt = FIRST_PROMPT
+    llm_with_tools = llm.bind_tools(tools)
+    for _ in range(max_turns):
+        messages.append(HumanMessage(content=prompt))
+        start = time.perf_counter()
+        try:
+            result = await agent.setupState(
+                query=prompt,
+                llm=llm_with_tools,
+                available_tools=tools,
+                messages=await history.window(messages, llm),
+                step=step,
+                current_document=document
+            )
+            answer = result["messages"][-1].content if result.get("messages") else ""
+        except Exception as e:
+            stats["errors"][type(e).__name__] += 1
+            return
+        stats["latencies"].append(time.perf_counter() - start)
+        stats["turns_per_document"][document] += 1
+        messages.append(AIMessage(content=answer))
+        step = result.get("step") or step
+
+        try:
+            window = await history.window(messages[:-1], llm)
+            prompts = Prompts(render_messages(window))
+            prompt = (await llm.ainvoke([
+                SystemMessage(content=prompts.get_student_simulation_prompt(answer))
+            ])).content.strip()
+        except Exception as e:
+            stats["errors"][type(e).__name__] += 1
+            return
+        if not prompt or "done" in prompt.lower():
+            stats["finished"] += 1
+            return
+    stats["finished"] += 1
+
+async def get_server_tools(url, transport):
+    session = MCPSessionManager(url, transport)
+    return session, await session.get_tools()
+
+async def run_load(args, documents):
+    Config.Providers.CHAT_MODEL = args.model
+    if args.offline:
+        Config.Providers.BACKEND = "fake"
+        Config.Providers.FAKE_LLM_LATENCY = args.llm_latency
+        Config.Providers.FAKE_TOKEN_LATENCY = args.token_latency
+    # Keep the benchmark from appending to the logs of real sessions
+    Config.Agent.TURN_LOG_PATH = None
+    llm = get_chat_model()
+
+    session = None
+    if args.fake_tools or (args.offline and not args.url):
+        tools = [fake_task_answer_tool(args.tool_latency)]
+    else:
+        session, tools = await get_server_tools(args.url, args.transport)
+
+    agent = Agent()
+    stats = {"latencies": [], "errors": Counter(), "finished": 0, "turns_per_document": Counter()}
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[
+            run_student(
+                agent, llm, tools, documents[i % len(documents)], args.turns,
+                args.ramp * i / args.students, stats
+            )
+            for i in range(args.students)
+        ])
+    finally:
+        if session is not None:
+            # close() blocks until the session's own event loop has disconnected
+            await asyncio.to_thread(session.close)
+    stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated students concurrently against the agent and the MCP server")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10, help="Maximum turns per student")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Seconds over which the students are started")
+    parser.add_argument("--tasks-dir", default="./data/tasks")
+    parser.add_argument("--url", default=None, help="MCP server URL (default from Config.Server)")
+    parser.add_argument("--transport", default=Config.Server.TRANSPORT, choices=["sse", "streamable-http"])
+    parser.add_argument("--model", default=Config.Providers.CHAT_MODEL)
+    parser.add_argument("--offline", action="store_true", help="Fake chat model (Config.Providers); fake tools unless --url is given")
+    parser.add_argument("--fake-tools", action="store_true", help="Answer get_task_answer locally instead of via MCP")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Offline: seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Offline: seconds per generated token")
+    parser.add_argument("--tool-latency", type=float, default=1.0, help="Fake tools: seconds per get_task_answer call")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    documents = task_documents(args.tasks_dir)
+    if not documents:
+        print(f"No task documents found in {args.tasks_dir}")
+        sys.exit(1)
+
+    # The agent prints every routing decision, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = asyncio.run(run_load(args, documents))
+
+    latencies = stats["latencies"]
+    errors = sum(stats["errors"].values())
+    attempted = len(latencies) + errors
+    results = {
+        "students": args.students,
+        "documents": len(documents),
+        "turns": len(latencies),
+        "finished_students": stats["finished"],
+        "errors": errors,
+        "error_rate": errors / attempted if attempted else 0.0,
+        "error_types": dict(stats["errors"]),
+        "elapsed": stats["elapsed"],
+        "throughput": len(latencies) / stats["elapsed"] if stats["elapsed"] else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "turns_per_document": dict(stats["turns_per_document"]),
+    }
+
+    print(f"{args.students} students over {len(documents)} task(s), {results['turns']} turns in {results['elapsed']:.1f}s")
+    print(f"  throughput   {results['throughput']:.2f} turns/s")
+    print(f"  turn latency p50 {results['p50']:.3f}s, p95 {results['p95']:.3f}s, p99 {results['p99']:.3f}s")
+    print(f"  errors       {errors} ({results['error_rate']:.1%}) {results['error_types'] or ''}")
+    print(f"  finished     {results['finished_students']}/{args.students} students")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
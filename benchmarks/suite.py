@@ -0,0 +1,176 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import platform
+import statistics
+import tempfile
+import time
+from benchmarks.helpers import percentile
+from common.config import Config
+
+QUERIES = [
+    ("What is my task?", "orientation"),
+    ("What is a fact table?", "orientation"),
+    ("Which dimensions would make sense here?", "conceptualization"),
+    ("How do I write the SQL query for the star schema?", "execution support"),
+]
+
+def measure(runs, func):
+    # One warm-up call, then `runs` timed calls; benchmarked code prints a lot, so stdout is dropped
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return {
+        "runs": runs,
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "min_ms": min(timings) * 1000,
+    }
+
+def run_suite(args):
+    # Heavy imports (Chroma, the server module) are only needed once the suite actually runs
+    from langchain_chroma import Chroma
+    from langchain_core.tools import StructuredTool
+    from chat_client.agent import Agent
+    from common.providers import get_chat_model
+    from server import server
+    from server.document_processor import DocumentProcessor
+
+    files = sorted(glob.glob(os.path.join(args.data_dir, "**", "*.docx"), recursive=True))
+    if not files:
+        raise SystemExit(f"No .docx files found in {args.data_dir}")
+    document = os.path.splitext(os.path.basename(files[0]))[0]
+
+    db_dir = tempfile.mkdtemp(prefix="benchmark_db_")
+    processor = DocumentProcessor(db_path=db_dir)
+    results = {}
+
+    texts = [processor.load_docx_prose_and_tables(f) for f in files]
+    results["docx_extraction"] = measure(args.runs, lambda: [processor.load_docx_prose_and_tables(f) for f in files])
+
+    def split():
+        docs = []
+        for filepath, (text, tables) in zip(files, texts):
+            doc_id = os.path.splitext(os.path.basename(filepath))[0]
+            chunks = processor.chunk_large_items(processor.extract_chunks(text, tables), doc_id, filepath)
+            docs.extend(processor.to_langchain_documents(chunks))
+        return docs
+
+    docs = split()
+    results["splitting"] = measure(args.runs, split)
+
+    db = Chroma(persist_directory=db_dir, embedding_function=processor.embedding_function)
+
+    def embed_and_insert():
+        db.reset_collection()
+        db.add_documents(docs)
+
+    results["embed_insert"] = measure(args.runs, embed_and_insert)
+
+    retriever = server.build_retriever(db)
+    results["retrieval"] = measure(args.runs, lambda: [retriever.invoke(query) for query, _ in QUERIES])
+
+    # The server module with its globals pointed at the benchmark index, as initialize_index would set them
+    server.processor = processor
+    server.retriever = retriever
+    server.chain = server.build_chain()
+    server.index_ready.set()
+
+    async def answer_all():
+        for query, step in QUERIES:
+            await server.get_task_answer(query, step, document)
+
+    results["get_task_answer"] = measure(args.runs, lambda: asyncio.run(answer_all()))
+
+    agent = Agent()
+    tool = StructuredTool.from_function(coroutine=server.get_task_answer, name="get_task_answer",
+                                        description="Retrieve material answering a question about the current task.")
+    llm = get_chat_model().bind_tools([tool])
+
+    async def agent_turns():
+        for query, _ in QUERIES:
+            await agent.setupState(query, llm, [tool], [], "orientation", document)
+
+    results["agent_turn"] = measure(args.runs, lambda: asyncio.run(agent_turns()))
+    return results
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"{'stage':<18} {'median (ms)':>12} {'p95 (ms)':>10} {'baseline':>10} {'change':>8}")
+    for stage, result in results.items():
+        reference = baseline.get("results", {}).get(stage) if baseline else None
+        line = f"{stage:<18} {result['median_ms']:>12.2f} {result['p95_ms']:>10.2f}"
+        if reference:
+            change = result["median_ms"] / reference["median_ms"] - 1 if reference["median_ms"] else 0.0
+            flag = "  REGRESSION" if change > tolerance else ""
+            line += f" {reference['median_ms']:>10.2f} {change:>+8.1%}{flag}"
+            if flag:
+                regressions.append(stage)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the ingestion, retrieval and agent pipeline with fake models")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Fake chat model: seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake chat model: seconds per generated token")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Fake embeddings: seconds per call")
+    parser.add_argument("--output", default="./benchmark_results.json")
+    parser.add_argument("--baseline", default=os.path.join(PROJECT_ROOT, "benchmarks", "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed median slowdown against the baseline")
+    args = parser.parse_args()
+
+    Config.Providers.BACKEND = "fake"
+    Config.Providers.FAKE_LLM_LATENCY = args.llm_latency
+    Config.Providers.FAKE_TOKEN_LATENCY = args.token_latency
+    Config.Providers.FAKE_EMBEDDING_LATENCY = args.embedding_latency
+    # Keep the benchmark from appending to the logs of real sessions
+    Config.Agent.TURN_LOG_PATH = None
+
+    meta = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": args.runs,
+        "llm_latency": args.llm_latency,
+        "token_latency": args.token_latency,
+        "embedding_latency": args.embedding_latency,
+    }
+    output = {"meta": meta, "results": run_suite(args)}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+
+    baseline = None
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        settings = ("llm_latency", "token_latency", "embedding_latency")
+        if any(baseline["meta"].get(key) != meta[key] for key in settings):
+            print("Warning: the baseline was recorded with different fake latencies")
+
+    regressions = compare(output["results"], baseline, args.tolerance)
+    if regressions:
+        print(f"Regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(PROJECT_ROOT)
+
+import argparse
+import asyncio
+import subprocess
+import time
+import httpx
+from benchmarks.helpers import percentile
+from chat_client.client import connect_to_server
+from common.config import Config
+
+TRANSPORTS = ["sse", "streamable-http"]
+
+def wait_until_live(base_url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}{Config.Server.HEALTH_PATH}", timeout=5).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+async def measure_call_latency(url, transport, calls):
+    # list_tools is a full MCP round trip that does not touch the index or the LLM
+    latencies = []
+    async with connect_to_server(url, transport) as session:
+        for _ in range(calls):
+            start = time.perf_counter()
+            await session.list_tools()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+async def open_session(url, transport, hold):
+    async with connect_to_server(url, transport) as session:
+        await session.list_tools()
+        await asyncio.sleep(hold)
+
+async def measure_capacity(url, transport, sessions, hold):
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[open_session(url, transport, hold) for _ in range(sessions)],
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    failures = sum(1 for result in results if isinstance(result, BaseException))
+    return sessions - failures, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SSE and streamable HTTP transports on localhost")
+    parser.add_argument("--transports", nargs="+", choices=TRANSPORTS, default=TRANSPORTS)
+    parser.add_argument("--calls", type=int, default=200, help="Sequential calls on one session")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 50, 100, 200], help="Concurrent session levels")
+    parser.add_argument("--hold", type=float, default=1.0, help="Seconds every session stays open")
+    parser.add_argument("--port", type=int, default=8300)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    for transport in args.transports:
+        env = dict(os.environ, MCP_TRANSPORT=transport, MCP_SERVER_PORT=str(args.port))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "server.server"],
+            cwd=PROJECT_ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not wait_until_live(base_url, 60):
+                print(f"{transport}: server did not start")
+                continue
+            path = Config.Server.STREAMABLE_HTTP_PATH if transport == "streamable-http" else Config.Server.SSE_PATH
+            url = f"{base_url}{path}"
+
+            latencies = asyncio.run(measure_call_latency(url, transport, args.calls))
+            print(f"\n{transport}")
+            print(f"  per-call latency over {len(latencies)} calls: "
+                  f"p50 {percentile(latencies, 50) * 1000:.2f} ms, p95 {percentile(latencies, 95) * 1000:.2f} ms")
+            for sessions in args.sessions:
+                succeeded, elapsed = asyncio.run(measure_capacity(url, transport, sessions, args.hold))
+                print(f"  {sessions:>5} concurrent sessions: {succeeded} succeeded in {elapsed:.2f}s")
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
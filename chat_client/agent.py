@@ -1,125 +1,287 @@
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_core.tools import BaseTool 
 from typing import Dict, Annotated
+from dataclasses import dataclass, field
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
+from langgraph.runtime import Runtime
 from typing_extensions import TypedDict
-from chat_client.tools import call_tool
+from chat_client.history import render_messages
+from chat_client.llm_cache import call_site
+from chat_client.router import EmbeddingRouter, LABELS
+from chat_client.tools import call_tool, tool_call_key
+from common import tracing
+from common.config import Config
 from common.prompts import Prompts
+import asyncio
 import json
+import time
+
+PREFETCH_TOOL = "get_task_answer"
+# Tags the LLM calls of the answer nodes, whose tokens are streamed to the chat
+ANSWER_TAG = "answer"
+BEST_EFFORT_PREFIX = "I could not finish the full answer in time. Here is what I found in the material so far:"
+BEST_EFFORT_EMPTY = "I could not finish the answer in time. Please try asking again, maybe in smaller steps."
 
 class State(TypedDict):
     query: str
-    llm: BaseChatModel
-    tools: list[BaseTool]
     history: list[BaseMessage]
     messages: Annotated[list, add_messages]
     step: str
     current_document: str
+    rag_query: str
+
+@dataclass
+class AgentContext:
+    llm: BaseChatModel
+    tools: list[BaseTool]
+    # Speculatively started tool calls of this run, keyed by tool_call_key
+    prefetched: dict[str, asyncio.Task] = field(default_factory=dict)
+    tools_by_name: dict[str, BaseTool] = field(init=False)
+    # Per-turn budget: wall-clock deadline (time.monotonic) and total LLM tokens
+    deadline: float | None = None
+    token_budget: int | None = None
+    tokens_used: int = 0
+    iterations: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def track_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            self.tokens_used += usage.get("total_tokens", 0)
+
+    def exhausted(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "timeout"
+        if self.token_budget is not None and self.tokens_used >= self.token_budget:
+            return "token_budget"
+        return None
 
 class Agent:
-    async def prepare_rag_query(self, history, query, llm, current_document):
-        prompts = Prompts(history, query, None, current_document)
+    def __init__(self, router: EmbeddingRouter | None = None):
+        self.router = router
+        self._graph = None
+
+    async def prepare_rag_query(self, history, query, llm, current_document, context: AgentContext | None = None):
+        prompts = Prompts(render_messages(history), query, None, current_document)
         prompt = prompts.get_rag_query_prompt()
         system = SystemMessage(content=prompt.strip())
         messages = [system]
-        result = await llm.ainvoke(messages)
+        with call_site("rag_query"), tracing.span("agent.rag_query"):
+            result = await llm.ainvoke(messages)
+        if context is not None:
+            context.track_usage(result)
         return result.content.strip()
 
-    async def assess(self, state: State) -> Dict:
-        query = state["query"]
-        llm = state["llm"]
-        tools = state["tools"]
-        history = state["messages"]
-        step = state.get("step")
-        current_document = state.get("current_document")
+    def prefetch_retrieval(self, context: AgentContext, rag_query, step, current_document):
+        # The node prompts tell the model to call get_task_answer with the rewritten query, the step and the document.
+        # Start that call now; it is only used if the model asks for exactly these arguments.
+        tool = context.tools_by_name.get(PREFETCH_TOOL)
+        if tool is None:
+            return
+        arguments = {"question": rag_query, "step": step, "current_document": current_document}
+        key = tool_call_key(PREFETCH_TOOL, arguments)
+        if key not in context.prefetched:
+            context.prefetched[key] = asyncio.create_task(self.prefetch(tool, arguments))
 
-        prompts = Prompts(history, query, step, current_document)
+    async def prefetch(self, tool, arguments):
+        with tracing.span("agent.prefetch", tool=tool.name):
+            return await tool.ainvoke(arguments)
 
-        rag_query = await self.prepare_rag_query(history, query, llm, current_document)
+    async def call_tool(self, tool_call, context: AgentContext) -> ToolMessage:
+        prefetched = context.prefetched.pop(tool_call_key(tool_call["name"], tool_call["args"]), None)
+        with tracing.span("agent.tool_call", tool=tool_call["name"], prefetched=prefetched is not None) as tool_span:
+            if prefetched is not None:
+                try:
+                    response = await prefetched
+                    return ToolMessage(content=str(response), tool_call_id=tool_call["id"])
+                except Exception as e:
+                    print(f"Prefetched tool call failed, calling again: {e}")
+                    tool_span.set(prefetch_failed=True)
+            return await call_tool(tool_call, context.tools_by_name)
 
-        system = SystemMessage(content=prompts.get_assessment_prompt().strip())
+    async def get_rag_query(self, state: State, llm, context: AgentContext):
+        # Normally rewritten by the classifier in parallel with the classification
+        if state.get("rag_query"):
+            return state["rag_query"]
+        return await self.prepare_rag_query(state["messages"], state["query"], llm, state.get("current_document"), context)
 
-        messages = history + [system, HumanMessage(content=rag_query)]
-        for _ in range(10):
-            response = await llm.ainvoke(messages)
-            messages.append(response)
-            if not response.tool_calls:
-                return {"messages": messages, "step": state["step"]}
-            for tool_call in response.tool_calls:
-                tool_response = await call_tool(tool_call, tools)
-                messages.append(tool_response)
-        raise RuntimeError("Max iterations reached in assess")
+    async def run_tool_calls(self, tool_calls, context: AgentContext) -> list[ToolMessage]:
+        # Identical calls of one model turn run once, distinct ones run concurrently up to the cap
+        unique_calls = {}
+        for tool_call in tool_calls:
+            unique_calls.setdefault(tool_call_key(tool_call["name"], tool_call["args"]), tool_call)
 
-    async def clarify(self, state: State) -> Dict:
-        query = state["query"]
-        llm = state["llm"]
-        tools = state["tools"]
-        history = state["messages"]
-        step = state.get("step")
-        current_document = state.get("current_document")
+        semaphore = asyncio.Semaphore(Config.Agent.MAX_TOOL_CONCURRENCY)
 
-        prompts = Prompts(history, query, step, current_document)
+        async def run(tool_call):
+            async with semaphore:
+                return await self.call_tool(tool_call, context)
 
-        rag_query = await self.prepare_rag_query(history, query, llm, current_document)
+        responses = await asyncio.gather(*[run(tool_call) for tool_call in unique_calls.values()])
+        contents = {key: response.content for key, response in zip(unique_calls, responses)}
+        return [
+            ToolMessage(content=contents[tool_call_key(tool_call["name"], tool_call["args"])], tool_call_id=tool_call["id"])
+            for tool_call in tool_calls
+        ]
 
-        system = SystemMessage(content=prompts.get_clarification_prompt().strip())
+    def best_effort_answer(self, turn_messages):
+        tool_results = [message.content for message in turn_messages if isinstance(message, ToolMessage) and message.content]
+        if not tool_results:
+            return BEST_EFFORT_EMPTY
+        return "\n\n".join([BEST_EFFORT_PREFIX] + tool_results[-Config.Agent.BEST_EFFORT_RESULTS:])
 
-        messages = history + [system, HumanMessage(content=rag_query)]
-        for _ in range(10):
-            response = await llm.ainvoke(messages)
-            messages.append(response)
-            if not response.tool_calls:
-                return {"messages": messages, "step": state["step"]}
-            for tool_call in response.tool_calls:
-                tool_response = await call_tool(tool_call, tools)
-                messages.append(tool_response)
-        raise RuntimeError("Max iterations reached in clarify")
+    def record_turn(self, node_name, context: AgentContext, stop_reason):
+        entry = {
+            "timestamp": time.time(),
+            "node": node_name,
+            "iterations": context.iterations,
+            "tokens": context.tokens_used,
+            "elapsed": round(time.monotonic() - context.started, 3),
+            "stop_reason": stop_reason,
+        }
+        print(f"turn: {entry}")
+        if not Config.Agent.TURN_LOG_PATH:
+            return
+        try:
+            with open(Config.Agent.TURN_LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+        except Exception as e:
+            print(f"Error writing turn log: {e}")
 
-    async def motivate(self, state: State) -> Dict:
-        query = state["query"]
-        llm = state["llm"]
-        tools = state["tools"]
-        history = state["messages"]
-        step = state.get("step")
-        current_document = state.get("current_document")
+    async def run_tool_loop(self, state: State, runtime: Runtime[AgentContext], system_prompt, include_history, node_name) -> Dict:
+        with tracing.span(f"agent.{node_name}") as node_span:
+            result, stop_reason = await self._run_tool_loop(state, runtime, system_prompt, include_history, node_name)
+            node_span.set(iterations=runtime.context.iterations, tokens=runtime.context.tokens_used, stop_reason=stop_reason)
+        return result
 
-        prompts = Prompts(history, query, step, current_document)
+    async def _run_tool_loop(self, state: State, runtime: Runtime[AgentContext], system_prompt, include_history, node_name):
+        context = runtime.context
+        llm = context.llm
+        history = state["messages"]
 
-        rag_query = await self.prepare_rag_query(history, query, llm, current_document)
+        rag_query = await self.get_rag_query(state, llm, context)
 
-        system = SystemMessage(content=prompts.get_motivation_prompt().strip())
+        system = SystemMessage(content=system_prompt.strip())
 
-        messages = [system, HumanMessage(content=rag_query)]
-        for _ in range(10):
-            response = await llm.ainvoke(messages)
+        messages = (history if include_history else []) + [system, HumanMessage(content=rag_query)]
+        turn_start = len(messages)
+        stop_reason = "max_iterations"
+        for _ in range(Config.Agent.MAX_ITERATIONS):
+            stop_reason = context.exhausted()
+            if stop_reason:
+                break
+            context.iterations += 1
+            try:
+                with call_site(node_name), tracing.span("agent.llm_call", iteration=context.iterations) as llm_span:
+                    response = await asyncio.wait_for(llm.ainvoke(messages, config={"tags": [ANSWER_TAG]}), context.remaining())
+                    llm_span.set(tool_calls=len(response.tool_calls))
+            except asyncio.TimeoutError:
+                stop_reason = "timeout"
+                break
+            context.track_usage(response)
             messages.append(response)
             if not response.tool_calls:
-                return {"messages": messages, "step": state["step"]}
+                self.record_turn(node_name, context, "answered")
+                return {"messages": messages, "step": state["step"]}, "answered"
             for tool_call in response.tool_calls:
-                tool_response = await call_tool(tool_call, tools)
-                messages.append(tool_response)
-        raise RuntimeError("Max iterations reached in motivate")
+                runtime.stream_writer({"status": f"Calling {tool_call['name']}..."})
+            try:
+                # wait_for cancels the tool calls still in flight when the budget runs out
+                tool_responses = await asyncio.wait_for(self.run_tool_calls(response.tool_calls, context), context.remaining())
+            except asyncio.TimeoutError:
+                messages.pop()
+                stop_reason = "timeout"
+                break
+            messages.extend(tool_responses)
+        else:
+            stop_reason = "max_iterations"
+
+        self.record_turn(node_name, context, stop_reason)
+        messages.append(AIMessage(content=self.best_effort_answer(messages[turn_start:])))
+        return {"messages": messages, "step": state["step"]}, stop_reason
 
-    async def classify_message(self, state: State) -> Dict:
+    def _prompts(self, state: State):
+        return Prompts(state["messages"], state["query"], state.get("step"), state.get("current_document"))
+
+    async def assess(self, state: State, runtime: Runtime[AgentContext]) -> Dict:
+        prompt = self._prompts(state).get_assessment_prompt()
+        return await self.run_tool_loop(state, runtime, prompt, include_history=True, node_name="assess")
+
+    async def clarify(self, state: State, runtime: Runtime[AgentContext]) -> Dict:
+        prompt = self._prompts(state).get_clarification_prompt()
+        return await self.run_tool_loop(state, runtime, prompt, include_history=True, node_name="clarify")
+
+    async def motivate(self, state: State, runtime: Runtime[AgentContext]) -> Dict:
+        prompt = self._prompts(state).get_motivation_prompt()
+        return await self.run_tool_loop(state, runtime, prompt, include_history=False, node_name="motivate")
+
+    async def classify_message(self, state: State, runtime: Runtime[AgentContext]) -> Dict:
         step = state["step"]
         query = state["query"]
         history = state["messages"]
-        llm = state["llm"]
+        llm = runtime.context.llm
+        current_document = state.get("current_document")
 
-        prompts = Prompts(history, query, step, None)
+        # The RAG query rewrite does not depend on the label: run it concurrently and start retrieval as soon as it is ready
+        async def rewrite_and_prefetch():
+            rag_query = await self.prepare_rag_query(history, query, llm, current_document, runtime.context)
+            self.prefetch_retrieval(runtime.context, rag_query, step, current_document)
+            return rag_query
 
+        label, rag_query = await asyncio.gather(self.classify(query, history, step, llm, runtime.context), rewrite_and_prefetch())
+        print(f"query: {query}")
+        print(f"query label: {label}")
+        runtime.stream_writer({"status": f"Phase: {label.replace('_', ' ')}"})
+        return {
+            "next": label,
+            "step": state["step"],
+            "rag_query": rag_query
+        }
+
+    async def classify(self, query, history, step, llm, context: AgentContext | None = None):
+        with tracing.span("agent.classify") as classify_span:
+            label, source = await self._classify(query, history, step, llm, context)
+            classify_span.set(label=label, source=source)
+        return label
+
+    async def _classify(self, query, history, step, llm, context: AgentContext | None = None):
+        router_label, confidence = None, 0.0
+        if self.router is not None:
+            try:
+                with tracing.span("router.route"):
+                    router_label, confidence = await self.router.route(query)
+            except Exception as e:
+                print(f"Router failed, falling back to the LLM: {e}")
+            if (router_label and self.router.is_confident(confidence)
+                    and self.router.is_allowed(router_label, step, history)):
+                self.router.log_decision(query, step, router_label, confidence, router_label, "router")
+                return router_label, "router"
+
+        prompts = Prompts(render_messages(history), query, step, None)
         system = SystemMessage(content=prompts.get_step_prompt().strip())
         messages = [system, HumanMessage(content=query)]
-        result = await llm.ainvoke(messages)
+        with call_site("classify"):
+            result = await llm.ainvoke(messages)
+        if context is not None:
+            context.track_usage(result)
         label = result.content.strip().lower()
-        print(f"query: {query}")
-        print(f"query label: {label}")
-        return {"next": label if label in ["orientation", "conceptualisation", "executive_support"] else "orientation", "step": state["step"]}
+        label = label if label in LABELS else "orientation"
+        if self.router is not None:
+            self.router.log_decision(query, step, router_label, confidence, label, "llm")
+        return label, "llm"
 
     def create_graph(self):
-        graph_builder = StateGraph(State)
+        graph_builder = StateGraph(State, context_schema=AgentContext)
 
         graph_builder.add_node("classifier", self.classify_message)
         graph_builder.add_node("orientation", self.clarify)
@@ -139,6 +301,20 @@ class Agent:
         graph = graph_builder.compile()
         return graph
 
+    @property
+    def graph(self):
+        # The graph does not depend on the LLM or tools (they come with the run context), so compile it once
+        if self._graph is None:
+            self._graph = self.create_graph()
+        return self._graph
+
+    def create_context(self, llm: BaseChatModel, available_tools: list[BaseTool]):
+        return AgentContext(
+            llm=llm,
+            tools=available_tools,
+            deadline=time.monotonic() + Config.Agent.TURN_TIMEOUT if Config.Agent.TURN_TIMEOUT else None,
+            token_budget=Config.Agent.TURN_TOKEN_BUDGET
+        )
 
     async def setupState(
         self,
@@ -151,12 +327,49 @@ class Agent:
     ):
         parameters = {
             "query": query,
-            "llm": llm,
-            "tools": available_tools,
             "messages": messages,
             "step": step,
             "current_document": current_document
         }
-        graph = self.create_graph()
-        state = await graph.ainvoke(parameters)
+        context = self.create_context(llm, available_tools)
+        try:
+            with tracing.span("agent.turn", step=step or "", document=current_document or ""):
+                state = await self.graph.ainvoke(parameters, context=context)
+        finally:
+            for task in context.prefetched.values():
+                task.cancel()
         return state
+
+    async def stream(
+        self,
+        query: str,
+        llm: BaseChatModel,
+        available_tools: list[BaseTool],
+        messages: list[BaseMessage],
+        step: str | None = None,
+        current_document: str | None = None
+    ):
+        # Same turn as setupState, yielding ("status", text) and ("token", text) events and finally ("result", state)
+        parameters = {
+            "query": query,
+            "messages": messages,
+            "step": step,
+            "current_document": current_document
+        }
+        context = self.create_context(llm, available_tools)
+        state = None
+        try:
+            with tracing.span("agent.turn", step=step or "", document=current_document or ""):
+                async for mode, chunk in self.graph.astream(parameters, context=context, stream_mode=["messages", "custom", "values"]):
+                    if mode == "messages":
+                        message, metadata = chunk
+                        if ANSWER_TAG in metadata.get("tags", []) and isinstance(message.content, str) and message.content:
+                            yield "token", message.content
+                    elif mode == "custom":
+                        yield "status", chunk["status"]
+                    else:
+                        state = chunk
+        finally:
+            for task in context.prefetched.values():
+                task.cancel()
+        yield "result", state
@@ -1,15 +1,194 @@
+import asyncio
 import contextlib
+import json
+import time
+from typing import Any
+import anyio
+import httpx
+from langchain_core.tools import BaseTool
 from mcp import ClientSession
 from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp import types
+from mcp.shared.exceptions import McpError
+from mcp.shared.session import ProgressFnT
+from mcp.types import CallToolResult
+from chat_client.event_loop import BackgroundEventLoop
+from chat_client.tools import convert_tools
+from common import tracing
 from common.config import Config
 
-def server_url():
+# Errors of a session whose connection is gone. Other errors, e.g. a request timeout, may come after the server ran the tool,
+# and ingest_document or remove_file must not run twice
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, httpx.TransportError)
+
+def is_connection_error(e: Exception) -> bool:
+    return isinstance(e, CONNECTION_ERRORS) or (isinstance(e, McpError) and e.error.code == types.CONNECTION_CLOSED)
+
+def server_url(transport: str = Config.Server.TRANSPORT):
     # Use localhost for client connections instead of 0.0.0.0
-    return f"http://localhost:{Config.Server.PORT}{Config.Server.SSE_PATH}"
+    path = Config.Server.STREAMABLE_HTTP_PATH if transport == "streamable-http" else Config.Server.SSE_PATH
+    return f"http://localhost:{Config.Server.PORT}{path}"
+
+def create_http_client(headers=None, timeout=None, auth=None) -> httpx.AsyncClient:
+    # Keep connections alive so the requests of a session reuse them instead of reconnecting
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        headers=headers,
+        timeout=timeout or httpx.Timeout(30.0),
+        auth=auth,
+        limits=httpx.Limits(
+            max_keepalive_connections=Config.Client.MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.Client.KEEPALIVE_EXPIRY,
+        ),
+    )
 
 @contextlib.asynccontextmanager
-async def connect_to_server(url: str = server_url()):
-    async with sse_client(url) as (read_stream, write_stream):
-        async with ClientSession(read_stream, write_stream) as session:
-            await session.initialize()
-            yield session
+async def connect_to_server(url: str | None = None, transport: str = Config.Server.TRANSPORT):
+    url = url or server_url(transport)
+    if transport == "streamable-http":
+        async with streamablehttp_client(url, httpx_client_factory=create_http_client) as (read_stream, write_stream, _):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                yield session
+    else:
+        async with sse_client(url, httpx_client_factory=create_http_client) as (read_stream, write_stream):
+            async with ClientSession(read_stream, write_stream) as session:
+                await session.initialize()
+                yield session
+
+class MCPSessionManager:
+    """Long-lived MCP session with a cached tool list.
+
+    The connection lives on a background event loop (shared with the rest of the client
+    when one is passed in), so callers running in any event loop can use it. Idle sessions are pinged before reuse and re-established
+    transparently when the server went away.
+    """
+
+    def __init__(
+        self,
+        url: str | None = None,
+        transport: str = Config.Server.TRANSPORT,
+        event_loop: BackgroundEventLoop | None = None
+    ):
+        self.url = url
+        self.transport = transport
+        self.tools_version = 0
+        self._tools: list[BaseTool] = []
+        self._tools_fingerprint = None
+        self._session: ClientSession | None = None
+        self._connection_task = None
+        self._closing = None
+        self._last_used = 0.0
+        self._lock = asyncio.Lock()
+        self._event_loop = event_loop or BackgroundEventLoop(name="mcp-session")
+
+    async def _connection(self, connected):
+        session = None
+        try:
+            async with connect_to_server(self.url, self.transport) as session:
+                self._session = session
+                connected.set_result(session)
+                await self._closing.wait()
+        except BaseException as e:
+            if not connected.done():
+                connected.set_exception(e)
+            else:
+                print(f"MCP connection closed: {e}")
+        finally:
+            if self._session is session:
+                self._session = None
+
+    async def _connect(self):
+        self._closing = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        connected = loop.create_future()
+        self._connection_task = loop.create_task(self._connection(connected))
+        with tracing.span("mcp.connect", transport=self.transport):
+            session = await connected
+        await self._refresh_tools(session)
+        return session
+
+    async def _disconnect(self):
+        if self._connection_task is not None:
+            self._closing.set()
+            try:
+                await asyncio.wait_for(self._connection_task, Config.Client.SESSION_HEALTH_CHECK_TIMEOUT)
+            except BaseException:
+                self._connection_task.cancel()
+        self._connection_task = None
+        self._session = None
+
+    async def _refresh_tools(self, session):
+        with tracing.span("mcp.list_tools"):
+            result = await session.list_tools()
+        fingerprint = json.dumps([tool.model_dump(mode="json") for tool in result.tools], sort_keys=True)
+        if fingerprint != self._tools_fingerprint:
+            self._tools = convert_tools(self, result.tools)
+            self._tools_fingerprint = fingerprint
+            self.tools_version += 1
+
+    async def _ensure_session(self):
+        async with self._lock:
+            idle = time.monotonic() - self._last_used
+            if self._session is not None and idle > Config.Client.SESSION_HEALTH_CHECK_INTERVAL:
+                try:
+                    with tracing.span("mcp.ping"):
+                        await asyncio.wait_for(self._session.send_ping(), Config.Client.SESSION_HEALTH_CHECK_TIMEOUT)
+                except Exception:
+                    print("MCP session is stale. Reconnecting...")
+                    await self._disconnect()
+            if self._session is None:
+                await self._connect()
+            self._last_used = time.monotonic()
+            return self._session
+
+    async def _reconnect(self):
+        async with self._lock:
+            await self._disconnect()
+            await self._connect()
+            self._last_used = time.monotonic()
+            return self._session
+
+    async def _get_tools(self, traceparent):
+        with tracing.span("mcp.get_tools", parent=traceparent):
+            await self._ensure_session()
+            return self._tools
+
+    @staticmethod
+    async def _send_tool_call(session, name, arguments, progress_callback=None):
+        # ClientSession.call_tool of this SDK version cannot set _meta, which carries the trace context to the server
+        traceparent = tracing.current_traceparent()
+        meta = {"traceparent": traceparent} if traceparent else None
+        params = types.CallToolRequestParams(name=name, arguments=arguments, _meta=meta)
+        request = types.ClientRequest(types.CallToolRequest(method="tools/call", params=params))
+        return await session.send_request(request, types.CallToolResult, progress_callback=progress_callback)
+
+    async def _call_tool(self, name, arguments, traceparent, progress_callback=None):
+        with tracing.span("mcp.call_tool", parent=traceparent, tool=name) as call_span:
+            session = await self._ensure_session()
+            try:
+                return await self._send_tool_call(session, name, arguments, progress_callback)
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                print(f"MCP call failed ({e!r}). Reconnecting...")
+                call_span.set(reconnected=True)
+                session = await self._reconnect()
+                return await self._send_tool_call(session, name, arguments, progress_callback)
+
+    # The session lives on another event loop, so the trace context is handed over explicitly
+    async def get_tools(self) -> list[BaseTool]:
+        return await self._event_loop.wrap(self._get_tools(tracing.current_traceparent()))
+
+    async def call_tool(
+        self,
+        name: str,
+        arguments: dict[str, Any] | None = None,
+        progress_callback: ProgressFnT | None = None
+    ) -> CallToolResult:
+        # progress_callback runs on the session's event loop
+        return await self._event_loop.wrap(self._call_tool(name, arguments, tracing.current_traceparent(), progress_callback))
+
+    def close(self):
+        self._event_loop.run(self._disconnect())
@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import time
+import uuid
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from common.config import Config
+
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+class ConversationStore:
+    """Chat conversations in a SQLite file, so they survive restarts of the Streamlit process.
+
+    Messages are stored as (role, text) rows clustered by conversation and position, so a conversation
+    is read with one index range scan. Each conversation also keeps its phase and the rolling summary
+    of ConversationHistory, so resuming it needs no LLM call.
+    """
+
+    def __init__(self, path: str = Config.Conversations.PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "id TEXT PRIMARY KEY, app TEXT NOT NULL, document TEXT, step TEXT, "
+            "summary TEXT NOT NULL DEFAULT '', summarized INTEGER NOT NULL DEFAULT 0, "
+            "created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS conversations_app_updated ON conversations (app, updated)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "conversation_id TEXT NOT NULL, position INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+            "PRIMARY KEY (conversation_id, position)) WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def create(self, app: str, document: str | None = None, step: str | None = None) -> str:
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO conversations (id, app, document, step, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (conversation_id, app, document, step, now, now),
+            )
+            self._connection.commit()
+        return conversation_id
+
+    def get(self, conversation_id: str) -> dict | None:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def update(self, conversation_id: str, **fields):
+        # document, step, summary and summarized
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._connection.execute(
+                f"UPDATE conversations SET {columns}, updated = ? WHERE id = ?",
+                (*fields.values(), time.time(), conversation_id),
+            )
+            self._connection.commit()
+
+    def append(self, conversation_id: str, message: BaseMessage):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO messages (conversation_id, position, role, content) "
+                "SELECT ?, COALESCE(MAX(position) + 1, 0), ?, ? FROM messages WHERE conversation_id = ?",
+                (conversation_id, message.type, message.content, conversation_id),
+            )
+            self._connection.execute("UPDATE conversations SET updated = ? WHERE id = ?", (time.time(), conversation_id))
+            self._connection.commit()
+
+    def messages(self, conversation_id: str) -> list[BaseMessage]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY position", (conversation_id,)
+            ).fetchall()
+        return [MESSAGE_TYPES[row["role"]](content=row["content"]) for row in rows]
+
+    def recent(self, app: str, limit: int = Config.Conversations.LIST_LIMIT) -> list[dict]:
+        # Latest conversations of an app, titled by their first message
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT c.id, c.document, c.updated, "
+                "(SELECT substr(m.content, 1, 60) FROM messages m WHERE m.conversation_id = c.id AND m.position = 0) AS title "
+                "FROM conversations c WHERE c.app = ? ORDER BY c.updated DESC LIMIT ?",
+                (app, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,91 @@
+import streamlit as st
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from chat_client.conversation_store import ConversationStore
+from chat_client.history import ConversationHistory
+from common.config import Config
+
+QUERY_PARAM = "conversation"
+
+def start_conversation():
+    # The conversation is stored once its first message is added
+    st.session_state.conversation_id = None
+    st.session_state.messages = []
+    st.session_state.history = ConversationHistory()
+    st.session_state.step = "orientation"
+    st.session_state.render_window = Config.Conversations.RENDER_WINDOW
+    st.query_params.pop(QUERY_PARAM, None)
+
+def open_conversation(store: ConversationStore, conversation_id: str | None):
+    conversation = store.get(conversation_id) if conversation_id else None
+    if conversation is None:
+        start_conversation()
+        return
+    history = ConversationHistory()
+    history.summary, history.summarized = conversation["summary"], conversation["summarized"]
+    st.session_state.conversation_id = conversation_id
+    st.session_state.messages = store.messages(conversation_id)
+    st.session_state.history = history
+    st.session_state.step = conversation["step"] or "orientation"
+    if conversation["document"]:
+        st.session_state.current_document = conversation["document"]
+    st.session_state.render_window = Config.Conversations.RENDER_WINDOW
+    st.query_params[QUERY_PARAM] = conversation_id
+
+def init_conversation(store: ConversationStore):
+    # Once per browser session: resume the conversation named in the URL, e.g. after a restart
+    if "conversation_id" not in st.session_state:
+        open_conversation(store, st.query_params.get(QUERY_PARAM))
+
+def add_message(store: ConversationStore, app: str, message: BaseMessage):
+    st.session_state.messages.append(message)
+    if st.session_state.conversation_id is None:
+        st.session_state.conversation_id = store.create(app, st.session_state.current_document, st.session_state.step)
+        st.query_params[QUERY_PARAM] = st.session_state.conversation_id
+    store.append(st.session_state.conversation_id, message)
+
+def save_conversation(store: ConversationStore):
+    # Phase, task and history summary after a turn, so a resumed conversation continues where it stopped
+    if st.session_state.conversation_id is None:
+        return
+    history = st.session_state.history
+    store.update(
+        st.session_state.conversation_id,
+        document=st.session_state.current_document,
+        step=st.session_state.step,
+        summary=history.summary,
+        summarized=history.summarized,
+    )
+
+def render_conversation_picker(store: ConversationStore, app: str):
+    st.header("💬 Conversations")
+    if st.button("➕ New conversation"):
+        start_conversation()
+        st.rerun()
+    current = st.session_state.conversation_id
+    titles = {
+        conversation["id"]: f"{conversation['title'] or '...'} ({conversation['document']})"
+        for conversation in store.recent(app)
+    }
+    options = list(titles) if current in titles else [current, *titles]
+    selected = st.selectbox(
+        "Resume a conversation:",
+        options,
+        index=options.index(current),
+        format_func=lambda conversation_id: titles.get(conversation_id, "New conversation")
+    )
+    if selected != current:
+        open_conversation(store, selected)
+        st.rerun()
+
+def render_chat_window(messages: list[BaseMessage]):
+    # Only the latest messages are rendered on a rerun, so its cost does not grow with the conversation
+    hidden = len(messages) - st.session_state.render_window
+    if hidden > 0 and st.button(f"⬆️ Show earlier messages ({hidden} hidden)"):
+        st.session_state.render_window += Config.Conversations.RENDER_PAGE
+        hidden -= Config.Conversations.RENDER_PAGE
+    for message in messages[max(hidden, 0):]:
+        if isinstance(message, SystemMessage):
+            continue
+        is_user = isinstance(message, HumanMessage)
+        with st.chat_message("user" if is_user else "ai", avatar="👤" if is_user else "🤖"):
+            st.markdown(message.content)
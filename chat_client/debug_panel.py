@@ -0,0 +1,30 @@
+import streamlit as st
+from common import tracing
+from common.config import Config
+
+SHOWN_TURNS = 10
+
+def render_turn_timings(trace_ids: list[str]):
+    # Sidebar summary of the tracing spans of the latest turns, newest first
+    with st.sidebar.expander("⏱️ Turn timings"):
+        if not trace_ids:
+            st.caption("No turns yet.")
+            return
+        st.caption(
+            "Seconds per stage; nested stages are included in their parents. Server stages are in "
+            f"`{Config.Tracing.SERVER_PATH}` under the same trace id."
+        )
+        first = max(len(trace_ids) - SHOWN_TURNS, 0)
+        for number in range(len(trace_ids), first, -1):
+            trace_id = trace_ids[number - 1]
+            summary = tracing.summarize_trace(trace_id)
+            if not summary["stages"]:
+                continue
+            st.markdown(f"**Turn {number}**: {summary['duration']:.2f}s  \n`{trace_id}`")
+            st.dataframe(
+                [
+                    {"stage": stage["stage"], "calls": stage["count"], "seconds": round(stage["seconds"], 3), "errors": stage["errors"]}
+                    for stage in summary["stages"]
+                ],
+                hide_index=True,
+            )
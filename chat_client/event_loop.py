@@ -0,0 +1,125 @@
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import httpx
+from common import rate_limit
+from common.config import Config
+
+class BackgroundEventLoop:
+    """A single long-lived event loop running on a daemon thread.
+
+    Coroutines from synchronous code (the Streamlit script thread) are submitted to it,
+    so loop-bound resources such as MCP sessions and HTTP connection pools survive between calls.
+    """
+
+    def __init__(self, name: str = "background-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+        self._pending: dict[str, concurrent.futures.Future] = {}
+        self._pending_lock = threading.Lock()
+        self._http_client: httpx.AsyncClient | None = None
+        self._openai_http_client: httpx.AsyncClient | None = None
+
+    def submit(self, coro, key: str | None = None) -> concurrent.futures.Future:
+        # Work submitted under a key replaces (and cancels) the previous unfinished work with that key
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if key is not None:
+            with self._pending_lock:
+                previous = self._pending.get(key)
+                self._pending[key] = future
+            if previous is not None and not previous.done():
+                previous.cancel()
+            future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self._pending_lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def run(self, coro, key: str | None = None, timeout: float | None = None):
+        future = self.submit(coro, key)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen, key: str | None = None):
+        # Consumes an async generator on this loop and hands its items to the calling thread as they arrive
+        items = queue.Queue()
+
+        async def pump():
+            async for item in agen:
+                items.put(("item", item))
+
+        def finished(done):
+            # Also called when the pump is cancelled before it starts, e.g. replaced by newer work under its key
+            if done.cancelled():
+                items.put(("error", concurrent.futures.CancelledError()))
+            elif done.exception() is not None:
+                items.put(("error", done.exception()))
+            else:
+                items.put(("done", None))
+
+        future = self.submit(pump(), key)
+        future.add_done_callback(finished)
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            # The consumer stopped early (e.g. a Streamlit rerun): stop producing as well
+            future.cancel()
+
+    def cancel(self, key: str) -> bool:
+        with self._pending_lock:
+            future = self._pending.pop(key, None)
+        return future.cancel() if future is not None else False
+
+    def wrap(self, coro):
+        # Awaitable from any event loop; runs directly when already on this loop
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            return coro
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def _client_options(self):
+        return dict(
+            timeout=httpx.Timeout(Config.Client.HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_keepalive_connections=Config.Client.MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=Config.Client.KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # Only used from coroutines running on this loop, so its connection pool stays valid
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(**self._client_options())
+        return self._http_client
+
+    @property
+    def openai_http_client(self) -> httpx.AsyncClient:
+        # Like http_client, but requests go through the shared OpenAI rate limiter
+        if self._openai_http_client is None:
+            options = self._client_options()
+            self._openai_http_client = rate_limit.async_http_client(**options) or httpx.AsyncClient(**options)
+        return self._openai_http_client
+
+    def close(self):
+        for client in (self._http_client, self._openai_http_client):
+            if client is not None:
+                asyncio.run_coroutine_threadsafe(client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
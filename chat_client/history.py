@@ -0,0 +1,103 @@
+from functools import lru_cache
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from chat_client.llm_cache import call_site
+from common import tracing
+from common.config import Config
+from common.prompts import Prompts
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # The encoding file is downloaded once and then cached; without it fall back to an estimate
+        print(f"Tokenizer {name} is not available, estimating token counts: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding(Config.History.ENCODING)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    encoding = get_encoding(Config.History.ENCODING)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+def render_messages(messages: list[BaseMessage] | None) -> str:
+    # Plain text for prompts instead of the Python repr of the message list
+    lines = []
+    for message in messages or []:
+        if isinstance(message, HumanMessage):
+            lines.append(f"Student: {message.content}")
+        elif isinstance(message, AIMessage) and message.content:
+            lines.append(f"Tutor: {message.content}")
+        elif isinstance(message, SystemMessage) and message.content.startswith(SUMMARY_PREFIX):
+            lines.append(message.content)
+    return "\n".join(lines)
+
+class ConversationHistory:
+    """Token-bounded view of one conversation.
+
+    The last turns are kept verbatim; older turns are folded into a rolling summary in batches,
+    so the summary is only recomputed for messages it has not seen yet.
+    """
+
+    def __init__(
+        self,
+        keep_turns: int = Config.History.KEEP_TURNS,
+        summary_batch_turns: int = Config.History.SUMMARY_BATCH_TURNS,
+        max_tokens: int = Config.History.MAX_TOKENS
+    ):
+        self.keep_turns = keep_turns
+        self.summary_batch_turns = summary_batch_turns
+        self.max_tokens = max_tokens
+        self.summary = ""
+        # Number of leading messages already folded into the summary
+        self.summarized = 0
+
+    def reset(self):
+        self.summary = ""
+        self.summarized = 0
+
+    def _turn_starts(self, messages):
+        return [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+
+    async def _fold(self, messages, llm):
+        prompts = Prompts(render_messages(messages))
+        with call_site("history_summary"), tracing.span("history.summary", messages=len(messages)):
+            result = await llm.ainvoke([SystemMessage(content=prompts.get_history_summary_prompt(self.summary).strip())])
+        self.summary = truncate_tokens(result.content.strip(), self.max_tokens // 2)
+
+    async def window(self, messages: list[BaseMessage], llm) -> list[BaseMessage]:
+        messages = [message for message in messages if not isinstance(message, SystemMessage)]
+        if len(messages) < self.summarized:
+            # A new conversation was started with the same history object
+            self.reset()
+
+        turn_starts = self._turn_starts(messages[self.summarized:])
+        # Fold only once a whole batch of turns has left the verbatim window, not on every turn
+        if len(turn_starts) >= self.keep_turns + self.summary_batch_turns:
+            cutoff = self.summarized + turn_starts[-self.keep_turns]
+            try:
+                await self._fold(messages[self.summarized:cutoff], llm)
+                self.summarized = cutoff
+            except Exception as e:
+                print(f"Error summarizing history, keeping it verbatim: {e}")
+
+        recent = messages[self.summarized:]
+        prefix = [SystemMessage(content=f"{SUMMARY_PREFIX}\n{self.summary}")] if self.summary else []
+        budget = self.max_tokens - sum(count_tokens(message.content) for message in prefix)
+        sizes = [count_tokens(message.content) for message in recent]
+        # Enforce the per-call cap: drop the oldest verbatim messages, then shorten what is left
+        while len(recent) > 1 and sum(sizes) > budget:
+            recent, sizes = recent[1:], sizes[1:]
+        if recent and sizes[0] > budget:
+            recent = [recent[0].model_copy(update={"content": truncate_tokens(recent[0].content, max(budget, 0))})]
+        return prefix + recent
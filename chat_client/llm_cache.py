@@ -0,0 +1,114 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from common.config import Config
+
+VOLATILE_MESSAGE_FIELDS = ("id", "usage_metadata", "response_metadata")
+
+_call_site = contextvars.ContextVar("llm_call_site", default="other")
+
+@contextlib.contextmanager
+def call_site(name: str):
+    # Labels the LLM calls made inside the block (including tasks started from it) for the cache statistics
+    token = _call_site.set(name)
+    try:
+        yield
+    finally:
+        _call_site.reset(token)
+
+class DiskLLMCache(BaseCache):
+    """Exact-match LLM response cache in a SQLite file.
+
+    The key covers the model and its parameters (including bound tools) and the serialized
+    messages. The least recently used entries are evicted above max_entries.
+    """
+
+    def __init__(self, path: str = Config.LLMCache.PATH, max_entries: int = Config.LLMCache.MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._connection.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        # Message ids and usage differ between a live and a replayed response of the same content
+        try:
+            messages = json.loads(prompt)
+            for message in messages:
+                for field in VOLATILE_MESSAGE_FIELDS:
+                    message.get("kwargs", {}).pop(field, None)
+            prompt = json.dumps(messages, sort_keys=True)
+        except (ValueError, AttributeError, TypeError):
+            pass
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _record(self, hit: bool):
+        site = _call_site.get()
+        self.stats[site]["hits" if hit else "misses"] += 1
+        hits, misses = self.stats[site]["hits"], self.stats[site]["misses"]
+        print(f"llm cache: {'hit' if hit else 'miss'} at {site}, hit rate {hits / (hits + misses):.0%}")
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._connection.commit()
+        if row is None:
+            self._record(False)
+            return None
+        try:
+            generations = loads(row[0])
+        except Exception as e:
+            print(f"Error reading cached response, calling the model: {e}")
+            self._record(False)
+            return None
+        self._record(True)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, last_used) VALUES (?, ?, ?)",
+                (key, dumps(return_val), time.time()),
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+
+    # Local SQLite calls are short, so the async variants skip the executor round trip
+    async def alookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+        self.stats.clear()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
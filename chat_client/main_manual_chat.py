@@ -4,29 +4,41 @@ import sys
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(PROJECT_ROOT)
 
-import asyncio
 import random
+import time
+import uuid
 import nest_asyncio
 from dotenv import load_dotenv
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage
 
 import streamlit as st
 from chat_client.agent import Agent
-from chat_client.client import connect_to_server
-from chat_client.tools import load_tools
-from langchain_openai import ChatOpenAI
-import threading
-from queue import Queue
-from server.document_processor import DocumentProcessor
+from chat_client.client import MCPSessionManager
+from chat_client.conversation_store import ConversationStore
+from chat_client.conversation_view import (
+    add_message, init_conversation, render_chat_window, render_conversation_picker, save_conversation
+)
+from chat_client.debug_panel import render_turn_timings
+from chat_client.event_loop import BackgroundEventLoop
+from chat_client.llm_cache import DiskLLMCache
+from chat_client.router import EmbeddingRouter
+from chat_client import uploads
+from common import tracing
+from common.config import Config
+from common.providers import get_chat_model, get_embeddings
 
 load_dotenv(override=True)
 nest_asyncio.apply()
+tracing.configure("gp-mcp-chat-client", Config.Tracing.CLIENT_PATH)
 
 LOADING_MESSAGES = [
     "Processing your request...",
     "Let me check that for you..."
 ]
 
+# Conversations of this app in the conversation store
+APP_NAME = "manual_chat"
+
 os.makedirs("./data/tasks", exist_ok=True)
 os.makedirs("./data/materials", exist_ok=True)
 
@@ -34,10 +46,35 @@ st.set_page_config(page_title="Teaching", layout="centered")
 st.title("Teaching Assistant")
 
 @st.cache_resource
-def get_document_processor():
-    return DocumentProcessor(db_path="./teaching_chroma_db")
+def get_event_loop():
+    return BackgroundEventLoop()
+
+event_loop = get_event_loop()
+
+@st.cache_resource
+def get_mcp_session():
+    return MCPSessionManager(event_loop=event_loop)
 
-processor = get_document_processor()
+mcp_session = get_mcp_session()
+
+@st.cache_resource
+def get_agent():
+    router = EmbeddingRouter(get_embeddings()) if Config.Router.ENABLED else None
+    return Agent(router=router)
+
+agent = get_agent()
+
+@st.cache_resource
+def get_llm_cache():
+    return DiskLLMCache() if Config.LLMCache.ENABLED else None
+
+llm_cache = get_llm_cache()
+
+@st.cache_resource
+def get_conversation_store():
+    return ConversationStore()
+
+conversation_store = get_conversation_store()
 
 def get_document_options():
     folder_path = './data/tasks'
@@ -51,29 +88,29 @@ def get_document_options():
         if os.path.isfile(os.path.join(folder_path, f)) and f.endswith('.docx')
     ]
 
-def save_uploaded_file(uploaded_file, target_folder):
+def upload_file(uploaded_file, folder, on_progress):
+    # The server stores and indexes the file; on_progress(fraction, message) follows its stages
     try:
-        target_path = os.path.join(target_folder, uploaded_file.name)
-        
-        if os.path.exists(target_path):
-            return False, f"File {uploaded_file.name} already exists"
-        
-        with open(target_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        return True, f"File {uploaded_file.name} successfully uploaded"
+        events = uploads.ingest_document(mcp_session, uploaded_file.name, folder, uploaded_file.getvalue())
+        for kind, value in event_loop.iterate(events):
+            if kind == "progress":
+                on_progress(*value)
+            else:
+                return True, value["chunks"]
     except Exception as e:
-        return False, f"Error uploading: {str(e)}"
+        return False, str(e)
 
-def process_uploaded_file(file_path):
+def remove_file(filename, folder):
     try:
-        docs = processor.process_single_file(file_path)
-        return True, len(docs)
+        result = event_loop.run(uploads.remove_document(mcp_session, filename, folder))
+        return True, result["removed_chunks"]
     except Exception as e:
         return False, str(e)
 
 document_options = get_document_options()
 
+init_conversation(conversation_store)
+
 with st.sidebar:
     st.header("📁 Upload files")
     
@@ -83,10 +120,8 @@ with st.sidebar:
         help="Select the folder to upload files"
     )
     
-    if file_type == "Tasks":
-        target_folder = "./data/tasks"
-    else:
-        target_folder = "./data/materials"
+    folder = "tasks" if file_type == "Tasks" else "materials"
+    target_folder = f"./data/{folder}"
     
     st.info(f"📂 Folder: `{target_folder}`")
     
@@ -110,43 +145,30 @@ with st.sidebar:
         if st.button("🚀 Upload files", type="primary"):
             success_count = 0
             error_count = 0
-            processed_count = 0
             
             progress_bar = st.progress(0)
             status_text = st.empty()
             
             for i, uploaded_file in enumerate(uploaded_files):
-                try:
-                    success, message = save_uploaded_file(uploaded_file, target_folder)
-                    
-                    if success:
-                        success_count += 1
-                        status_text.text(f"Uploaded: {uploaded_file.name}")
-                        
-                        file_path = os.path.join(target_folder, uploaded_file.name)
-                        with st.spinner(f"Processing {uploaded_file.name}..."):
-                            process_success, result = process_uploaded_file(file_path)
-                            if process_success:
-                                processed_count += 1
-                                st.success(f"✅ {uploaded_file.name} processed ({result} chunks)")
-                            else:
-                                st.error(f"❌ Error processing {uploaded_file.name}: {result}")
-                    else:
-                        error_count += 1
-                        st.warning(message)
-                    
-                except Exception as e:
+                def on_progress(fraction, message):
+                    status_text.text(f"{uploaded_file.name}: {message}")
+                    progress_bar.progress(min(1.0, (i + fraction) / len(uploaded_files)))
+
+                with st.spinner(f"Processing {uploaded_file.name}..."):
+                    success, result = upload_file(uploaded_file, folder, on_progress)
+                if success:
+                    success_count += 1
+                    st.success(f"✅ {uploaded_file.name} processed ({result} chunks)")
+                else:
                     error_count += 1
-                    st.error(f"Error uploading {uploaded_file.name}: {str(e)}")
+                    st.error(f"❌ Error processing {uploaded_file.name}: {result}")
                 
                 progress_bar.progress((i + 1) / len(uploaded_files))
             
             if success_count > 0:
                 st.success(f"✅ Successfully uploaded {success_count} files")
-                if processed_count > 0:
-                    st.success(f"🔄 Processed {processed_count} files")
-                    st.balloons()
-                    st.info("🎉 New files are ready to use!")
+                st.balloons()
+                st.info("🎉 New files are ready to use!")
                 if error_count > 0:
                     st.warning(f"⚠️ Errors uploading: {error_count}")
                 
@@ -154,6 +176,23 @@ with st.sidebar:
             else:
                 st.error("❌ Failed to upload any files")
 
+    st.header("🗑️ Remove files")
+    removable_files = sorted(f for f in os.listdir(target_folder) if f.endswith('.docx'))
+    if removable_files:
+        file_to_remove = st.selectbox("File to remove:", removable_files)
+        if st.button("🗑️ Remove file"):
+            with st.spinner(f"Removing {file_to_remove}..."):
+                success, result = remove_file(file_to_remove, folder)
+            if success:
+                st.success(f"✅ {file_to_remove} removed ({result} chunks)")
+                st.rerun()
+            else:
+                st.error(f"❌ Error removing {file_to_remove}: {result}")
+    else:
+        st.write("No files in this folder.")
+
+    render_conversation_picker(conversation_store, APP_NAME)
+
 if "current_document" not in st.session_state:
     st.session_state.current_document = document_options[0] if document_options else None
 
@@ -173,65 +212,67 @@ else:
     st.session_state.current_document = None
 
 if "llm" not in st.session_state:
-    st.session_state.llm = ChatOpenAI(model='gpt-4.1-mini', api_key=os.getenv("OPENAI_API_KEY"))
+    st.session_state.llm = get_chat_model(http_async_client=event_loop.openai_http_client, cache=llm_cache)
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "run_key" not in st.session_state:
+    st.session_state.run_key = uuid.uuid4().hex
 
-if "step" not in st.session_state:
-    st.session_state.step = "orientation"
+if "trace_ids" not in st.session_state:
+    st.session_state.trace_ids = []
 
-async def handle_query(prompt, llm, messages, step, current_document):
-    async with connect_to_server() as session:
-        tools = await load_tools(session)
+async def handle_query(prompt, llm, messages, step, current_document, history):
+    # One trace per turn; its id goes first so the debug panel can find the spans
+    with tracing.span("chat.turn", step=step or "", document=current_document or "") as turn_span:
+        yield "trace", turn_span.trace_id
+        tools = await mcp_session.get_tools()
         llm_with_tools = llm.bind_tools(tools)
+        # Recent turns verbatim plus a rolling summary of the older ones, capped in tokens
+        messages = await history.window(messages, llm)
 
-        agent = Agent()
-
-        result_state = await agent.setupState(
+        async for event in agent.stream(
             query=prompt,
             llm=llm_with_tools,
             available_tools=tools,
             messages=messages,
             step=step,
             current_document=current_document
-        )
-        return result_state
-
-def run_async_function(coro):
-    q = Queue()
-
-    def runner():
-        try:
-            result = asyncio.run(coro)
-            q.put(result)
-        except BaseException as e:
-            import traceback
-            traceback.print_exc()
-            q.put(e)
-
-    thread = threading.Thread(target=runner)
-    thread.start()
-    thread.join()
-
-    result = q.get()
-    if isinstance(result, BaseException):
-        raise result
+        ):
+            yield event
+
+def stream_to_placeholder(events, placeholder):
+    # Status updates until the answer starts, then the answer token by token
+    text = ""
+    last_render = 0.0
+    result = {}
+    try:
+        for kind, value in event_loop.iterate(events, key=st.session_state.run_key):
+            if kind == "trace":
+                if value:
+                    st.session_state.trace_ids.append(value)
+            elif kind == "status":
+                # A tool call after streamed text means that text was not the final answer
+                text = ""
+                placeholder.status(value, state="running")
+            elif kind == "token":
+                text += value
+                if time.monotonic() - last_render >= Config.Client.STREAM_RENDER_INTERVAL:
+                    placeholder.markdown(text + "▌")
+                    last_render = time.monotonic()
+            else:
+                result = value or {}
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        raise
     return result
 
-for message in st.session_state.messages:
-    if isinstance(message, SystemMessage):
-        continue
-    is_user = isinstance(message, HumanMessage)
-    avatar = "👤" if is_user else "🤖"
-    with st.chat_message("user" if is_user else "ai", avatar=avatar):
-        st.markdown(message.content)
+render_chat_window(st.session_state.messages)
 
 if prompt := st.chat_input("What can I help you with?"):
     if not st.session_state.current_document:
         st.error("⚠️ Please upload and select a task in the sidebar.")
     else:
-        st.session_state.messages.append(HumanMessage(content=prompt))
+        add_message(conversation_store, APP_NAME, HumanMessage(content=prompt))
 
         with st.chat_message("user", avatar="👤"):
             st.markdown(prompt)
@@ -241,13 +282,14 @@ if prompt := st.chat_input("What can I help you with?"):
             placeholder.status(random.choice(LOADING_MESSAGES), state="running")
 
             try:
-                result = run_async_function(handle_query(
+                result = stream_to_placeholder(handle_query(
                     prompt,
                     st.session_state.llm,
                     st.session_state.messages,
                     st.session_state.step,
-                    st.session_state.current_document
-                ))
+                    st.session_state.current_document,
+                    st.session_state.history
+                ), placeholder)
 
                 last_message = ""
                 if "messages" in result and result["messages"]:
@@ -256,10 +298,13 @@ if prompt := st.chat_input("What can I help you with?"):
                 placeholder.markdown(last_message)
 
                 if "messages" in result and last_message:
-                    st.session_state.messages.append(AIMessage(content=last_message))
+                    add_message(conversation_store, APP_NAME, AIMessage(content=last_message))
 
                 if "step" in result:
                     st.session_state.step = result["step"]
+                save_conversation(conversation_store)
 
             except Exception as e:
                 placeholder.error(f"An error occurred: {e}")
+
+render_turn_timings(st.session_state.trace_ids)
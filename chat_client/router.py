@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from common.config import Config
+
+LABELS = ["orientation", "conceptualisation", "executive_support"]
+# Steps as the apps and the server name them
+STEP_LABELS = {"conceptualization": "conceptualisation", "execution support": "executive_support"}
+
+# Seed examples per phase; LLM-labelled queries from the decision log are added on top of them
+ROUTER_EXAMPLES = {
+    "orientation": [
+        "What is my task?",
+        "Can you explain the assignment?",
+        "I don't understand what I have to do",
+        "What does this term mean?",
+        "What is a fact table?",
+        "Can you rephrase the task in simpler words?",
+        "What is the goal of this exercise?",
+        "Was ist meine Aufgabe?",
+    ],
+    "conceptualisation": [
+        "How should I approach this problem?",
+        "Which dimensions would make sense here?",
+        "What would be a good strategy to solve it?",
+        "How do facts and dimensions relate to each other?",
+        "Why would we use a star schema here?",
+        "I think the sales amount is a fact, is that right?",
+        "What should I consider before designing the model?",
+        "Can you give me an example of a similar solution approach?",
+    ],
+    "executive_support": [
+        "Here is my solution, can you check it?",
+        "My query returns an error, how do I fix it?",
+        "I wrote this SQL, what is wrong with it?",
+        "How can I improve my model?",
+        "This is my table design: can you review it?",
+        "Can you help me debug this?",
+        "What is the next step of my implementation?",
+        "I implemented the fact table, what's missing?",
+    ],
+}
+
+class EmbeddingRouter:
+    """Nearest-centroid phase classifier over query embeddings.
+
+    Routes are only trusted when the softmax confidence reaches the threshold; otherwise the
+    caller falls back to the LLM and reports its label back, which is logged for retraining.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        examples: dict[str, list[str]] = ROUTER_EXAMPLES,
+        threshold: float = Config.Router.CONFIDENCE_THRESHOLD,
+        temperature: float = Config.Router.TEMPERATURE,
+        min_similarity: float = Config.Router.MIN_SIMILARITY,
+        log_path: str | None = Config.Router.LOG_PATH
+    ):
+        self.embeddings = embeddings
+        self.examples = {label: list(examples.get(label, [])) for label in LABELS}
+        self.threshold = threshold
+        self.temperature = temperature
+        self.min_similarity = min_similarity
+        self.log_path = log_path
+        self.decisions = 0
+        self.fallbacks = 0
+        self._centroids = None
+        self._lock = asyncio.Lock()
+        if log_path:
+            self._add_logged_examples(log_path)
+
+    def _add_logged_examples(self, log_path):
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("source") == "llm" and entry.get("label") in self.examples:
+                    if entry["query"] not in self.examples[entry["label"]]:
+                        self.examples[entry["label"]].append(entry["query"])
+
+    async def _fit(self):
+        texts = [text for label in LABELS for text in self.examples[label]]
+        vectors = self._normalize(np.asarray(await self.embeddings.aembed_documents(texts), dtype=np.float32))
+        centroids = []
+        start = 0
+        for label in LABELS:
+            count = len(self.examples[label])
+            centroids.append(vectors[start:start + count].mean(axis=0))
+            start += count
+        self._centroids = self._normalize(np.vstack(centroids))
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    async def route(self, query: str) -> tuple[str, float]:
+        async with self._lock:
+            if self._centroids is None:
+                await self._fit()
+        vector = self._normalize(np.asarray(await self.embeddings.aembed_query(query), dtype=np.float32))
+        similarities = self._centroids @ vector
+        scores = similarities / self.temperature
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        # Far from every centroid: the softmax would still pick a winner, so report no confidence
+        if similarities[best] < self.min_similarity:
+            return LABELS[best], 0.0
+        return LABELS[best], float(probabilities[best])
+
+    def is_confident(self, confidence: float) -> bool:
+        return confidence >= self.threshold
+
+    @staticmethod
+    def is_allowed(label: str, step: str | None, history) -> bool:
+        # The router only sees the query, while the classifier prompt decides phase changes from the history:
+        # the router may only keep the conversation in its current phase
+        if not history:
+            return False
+        return label == STEP_LABELS.get(step, step or "orientation")
+
+    def log_decision(self, query, step, router_label, confidence, label, source):
+        self.decisions += 1
+        if source == "llm":
+            self.fallbacks += 1
+        print(f"router: {router_label} ({confidence:.2f}), used {label} from {source}, "
+              f"fallback rate {self.fallbacks / self.decisions:.0%}")
+        if not self.log_path:
+            return
+        entry = {
+            "timestamp": time.time(),
+            "query": query,
+            "step": step,
+            "router_label": router_label,
+            "confidence": round(confidence, 4),
+            "label": label,
+            "source": source,
+        }
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Error writing router log: {e}")
@@ -1,3 +1,4 @@
+import json
 from typing import Any
 
 from langchain_core.messages import ToolMessage
@@ -43,12 +44,21 @@ def _convert_mcp_to_langchain_tool(
         coroutine=call_tool,
     )
 
-async def call_tool(tool_call: ToolCall, available_tools: list[BaseTool]) -> ToolMessage:
-    tools_by_name = {tool.name: tool for tool in available_tools}
+def tool_call_key(name: str, arguments: dict[str, Any]) -> str:
+    return json.dumps([name, arguments], sort_keys=True, default=str)
+
+async def call_tool(tool_call: ToolCall, tools_by_name: dict[str, BaseTool]) -> ToolMessage:
     tool = tools_by_name[tool_call["name"]]
     response = await tool.ainvoke(tool_call["args"])
     return ToolMessage(content=str(response), tool_call_id=tool_call["id"])
 
+def is_model_tool(tool: MCPTool) -> bool:
+    # Tools that change the index (ingest_document, remove_document) are for the upload sidebar, not for the model
+    return not (tool.annotations and tool.annotations.readOnlyHint is False)
+
+def convert_tools(session: ClientSession, tools: list[MCPTool]) -> list[BaseTool]:
+    return [_convert_mcp_to_langchain_tool(session, tool) for tool in tools if is_model_tool(tool)]
+
 async def load_tools(session: ClientSession) -> list[BaseTool]:
     tools = await session.list_tools()
-    return [_convert_mcp_to_langchain_tool(session, tool) for tool in tools.tools]
+    return convert_tools(session, tools.tools)
@@ -0,0 +1,37 @@
+import asyncio
+import base64
+import json
+from mcp.types import CallToolResult, TextContent
+from langchain_core.tools import ToolException
+from chat_client.client import MCPSessionManager
+
+# The MCP server is the only writer of the index and ./data: the Streamlit apps send it the file bytes
+
+def tool_result(result: CallToolResult) -> dict:
+    text = " ".join(content.text for content in result.content if isinstance(content, TextContent))
+    if result.isError:
+        raise ToolException(text)
+    return result.structuredContent if result.structuredContent is not None else json.loads(text)
+
+async def ingest_document(mcp_session: MCPSessionManager, filename: str, folder: str, content: bytes):
+    # Yields ("progress", (fraction, message)) while the server indexes the file, then ("done", result)
+    loop = asyncio.get_running_loop()
+    updates = asyncio.Queue()
+
+    async def on_progress(progress, total, message):
+        # Called on the session's event loop, which need not be this one
+        loop.call_soon_threadsafe(updates.put_nowait, (progress / total if total else 0.0, message or ""))
+
+    arguments = {"filename": filename, "folder": folder, "content_base64": base64.b64encode(content).decode("ascii")}
+    call = asyncio.ensure_future(mcp_session.call_tool("ingest_document", arguments, progress_callback=on_progress))
+    call.add_done_callback(lambda done: loop.call_soon_threadsafe(updates.put_nowait, None))
+    try:
+        while (update := await updates.get()) is not None:
+            yield "progress", update
+        yield "done", tool_result(call.result())
+    finally:
+        # Stops waiting only: the server finishes the file, a repeated upload then reports it as indexed
+        call.cancel()
+
+async def remove_document(mcp_session: MCPSessionManager, filename: str, folder: str) -> dict:
+    return tool_result(await mcp_session.call_tool("remove_document", {"filename": filename, "folder": folder}))
@@ -1,5 +1,132 @@
+import os
+
 class Config:
+    class Providers:
+        # "openai" or "fake" (deterministic local stand-ins from common/fakes.py, for offline runs and benchmarks)
+        BACKEND = os.getenv("MODEL_PROVIDER", "openai")
+        CHAT_MODEL = "gpt-4.1-mini"
+        FAKE_LLM_LATENCY = 0.0
+        FAKE_TOKEN_LATENCY = 0.0
+        FAKE_EMBEDDING_LATENCY = 0.0
+        FAKE_EMBEDDING_DIMENSIONS = 256
+
     class Server:
         PORT = 8000
         SSE_PATH = "/sse"
-        TRANSPORT = "sse"
\ No newline at end of file
+        STREAMABLE_HTTP_PATH = "/mcp"
+        # "sse" or "streamable-http"
+        TRANSPORT = "sse"
+        # Streamable HTTP only: without server-side sessions any node can answer any request
+        STATELESS_HTTP = True
+        JSON_RESPONSE = False
+        HEALTH_PATH = "/healthz"
+        READY_PATH = "/readyz"
+        SNAPSHOT_PATH = "./teaching_index.snapshot"
+        WORKERS = 4
+        # Retriever of get_task_answer; compare settings with benchmarks/retrieval_eval.py
+        SEARCH_TYPE = "mmr"
+        SEARCH_K = 4
+        SEARCH_FETCH_K = 20
+        SEARCH_LAMBDA_MULT = 0.5
+        METRICS_PATH = "/metrics"
+        # Concurrent get_task_answer calls with the same normalized arguments share one computation
+        COALESCE_REQUESTS = True
+
+    class Tables:
+        # Docx tables become "table" chunks without the LLM splitter; longer tables are split, each part keeps the header row
+        MAX_ROWS = 20
+
+    class Dedup:
+        # Ingestion drops a chunk if THRESHOLD of its word shingles occur in a chunk kept before (server/dedup.py)
+        ENABLED = True
+        THRESHOLD = 0.8
+        SHINGLE_WORDS = 3
+        # MinHash permutations split into LSH bands; fewer rows per band also find short chunks inside long ones
+        NUM_PERM = 64
+        BANDS = 32
+        SEED = 1
+
+    class Client:
+        HTTP_TIMEOUT = 120
+        MAX_KEEPALIVE_CONNECTIONS = 10
+        KEEPALIVE_EXPIRY = 60
+        # Ping a reused MCP session before use if it has been idle for longer than this
+        SESSION_HEALTH_CHECK_INTERVAL = 30
+        SESSION_HEALTH_CHECK_TIMEOUT = 5
+        # Minimum seconds between re-renders of a streamed answer
+        STREAM_RENDER_INTERVAL = 0.05
+
+    class Agent:
+        MAX_ITERATIONS = 10
+        # Distinct tool calls of one model turn that may run at the same time
+        MAX_TOOL_CONCURRENCY = 4
+        # Per-turn budget; when it runs out the agent answers with the tool results gathered so far
+        TURN_TIMEOUT = 60
+        TURN_TOKEN_BUDGET = 60000
+        BEST_EFFORT_RESULTS = 2
+        TURN_LOG_PATH = "./agent_turns.jsonl"
+
+    class History:
+        # Turns kept verbatim; older ones are folded into a rolling summary in batches
+        KEEP_TURNS = 6
+        SUMMARY_BATCH_TURNS = 4
+        # Token cap for the history sent with one LLM call
+        MAX_TOKENS = 4000
+        ENCODING = "o200k_base"
+
+    class Conversations:
+        # Chat conversations are kept in SQLite and resumed through the ?conversation= URL parameter
+        PATH = "./conversations.sqlite"
+        # Messages rendered on each Streamlit rerun; older ones are shown RENDER_PAGE at a time on request
+        RENDER_WINDOW = 20
+        RENDER_PAGE = 20
+        # Recent conversations offered in the sidebar
+        LIST_LIMIT = 20
+
+    class LLMCache:
+        # Opt-in persistent cache of chat model responses, e.g. for replaying simulations offline
+        ENABLED = False
+        PATH = "./llm_cache.sqlite"
+        MAX_ENTRIES = 10000
+
+    class RateLimit:
+        # Shared by all OpenAI calls of one process (common/rate_limit.py); set below the account limits
+        ENABLED = True
+        REQUESTS_PER_MINUTE = 450
+        TOKENS_PER_MINUTE = 180000
+        # Budget that may be spent at once; the API enforces its per-minute limits over shorter windows too
+        BURST_SECONDS = 1
+        # Completion tokens assumed for a chat request without max_tokens
+        COMPLETION_TOKEN_ESTIMATE = 500
+        # Adaptive concurrency: cut by DECREASE_FACTOR on throttling (at most once per DECREASE_INTERVAL seconds)
+        MAX_CONCURRENCY = 16
+        MIN_CONCURRENCY = 1
+        DECREASE_FACTOR = 0.5
+        DECREASE_INTERVAL = 1.0
+        # Retries of 429, 5xx and connection errors with jittered exponential backoff, or after the retry-after hint
+        MAX_RETRIES = 6
+        BASE_DELAY = 0.5
+        MAX_DELAY = 30
+
+    class Tracing:
+        # Per-stage timing spans (common/tracing.py), exported as OpenTelemetry JSON lines
+        ENABLED = True
+        CLIENT_PATH = "./traces_client.jsonl"
+        SERVER_PATH = "./traces_server.jsonl"
+        # Traces kept in memory per process for the Streamlit debug panel
+        KEEP_TRACES = 100
+
+    class Metrics:
+        # USD per million tokens of Providers.CHAT_MODEL, for the estimated cost on /metrics
+        PROMPT_PRICE_PER_MILLION = 0.40
+        COMPLETION_PRICE_PER_MILLION = 1.60
+        # Distinct document labels before further documents are counted as "other"
+        MAX_DOCUMENT_LABELS = 100
+
+    class Router:
+        # Local embedding router in front of the LLM phase classifier
+        ENABLED = True
+        CONFIDENCE_THRESHOLD = 0.75
+        TEMPERATURE = 0.05
+        MIN_SIMILARITY = 0.3
+        LOG_PATH = "./router_decisions.jsonl"
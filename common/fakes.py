@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+LABELS = ["orientation", "conceptualisation", "executive_support"]
+CHUNK_TYPES = ["concept", "instruction", "example", "definition", "qa", "solution"]
+CHUNK_WORDS = 100
+
+STUDENT_QUESTIONS = [
+    "Can you explain it in simpler words?",
+    "Can you give me an example?",
+    "What is a fact table?",
+    "How do facts and dimensions relate to each other?",
+    "Which dimensions would make sense here?",
+    "Can you just give me the solution?",
+    "Here is my solution: a sales fact table with date, product and store dimensions. Is it right?",
+]
+
+TOOL_ARGUMENTS_PATTERN = re.compile(r"current step: (\S+?) and the current document: (.+?) when calling")
+LATEST_QUESTION_PATTERN = re.compile(r"Latest user question:\s*\n\s*(.+?)\s*\n")
+EMPTY_HISTORY_PATTERN = re.compile(r"Chat History:\s*User Query:")
+WORD_PATTERN = re.compile(r"\w+")
+
+def stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+def split_into_chunks(doc_text: str) -> list[dict]:
+    # What the LLM splitter returns: consecutive table rows stay together, other lines are grouped into ~CHUNK_WORDS words
+    chunks, lines, table = [], [], []
+
+    def flush_text():
+        if lines:
+            chunks.append({"type": CHUNK_TYPES[len(chunks) % len(CHUNK_TYPES)], "text": " ".join(lines)})
+            lines.clear()
+
+    for line in doc_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if " | " in line:
+            flush_text()
+            table.append(line)
+            continue
+        if table:
+            chunks.append({"type": "table", "text": "\n".join(table)})
+            table = []
+        lines.append(line)
+        if sum(len(l.split()) for l in lines) >= CHUNK_WORDS:
+            flush_text()
+    if table:
+        chunks.append({"type": "table", "text": "\n".join(table)})
+    flush_text()
+    return chunks
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic offline stand-in for the chat model.
+
+    It recognises the prompts of this project (phase classifier, RAG query rewrite, tutor nodes,
+    history summary, student simulation) and answers them plausibly, with a configurable delay
+    before the first token and between tokens. The same input always gives the same output.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_words: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"answer_words": self.answer_words}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _respond(self, messages, tools) -> AIMessage:
+        system = "\n".join(m.content for m in messages if isinstance(m, SystemMessage))
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+        turn = messages[last_human:]
+
+        if "learning phase evaluator" in system:
+            if EMPTY_HISTORY_PATTERN.search(system):
+                return AIMessage(content="orientation")
+            return AIMessage(content=LABELS[stable_hash(turn[0].content) % len(LABELS)])
+
+        if "resolve references" in system:
+            match = LATEST_QUESTION_PATTERN.search(system)
+            question = match.group(1) if match else "What is my task"
+            return AIMessage(content=f"{question} (current task)")
+
+        if "semantic chunks" in system:
+            return AIMessage(content=json.dumps(split_into_chunks(turn[0].content), ensure_ascii=False))
+
+        if isinstance(turn[0], HumanMessage) and "Here is the question to answer:" in turn[0].content:
+            words = turn[0].content.split()
+            return AIMessage(content="Based on the data: " + " ".join(words[:self.answer_words]))
+
+        if "summarizing a tutoring conversation" in system:
+            return AIMessage(content="The student asked about the task and discussed facts and dimensions.")
+
+        if "simulating a motivated, curious student" in system:
+            return AIMessage(content=STUDENT_QUESTIONS[stable_hash(system) % len(STUDENT_QUESTIONS)])
+
+        if tools and not any(isinstance(m, ToolMessage) for m in turn):
+            match = TOOL_ARGUMENTS_PATTERN.search(system)
+            step, document = match.groups() if match else ("orientation", "")
+            arguments = {"question": turn[0].content, "step": step, "current_document": document}
+            call_id = f"call_{stable_hash(json.dumps(arguments, sort_keys=True)) % 10**12}"
+            return AIMessage(content="", tool_calls=[{"name": tools[0]["function"]["name"], "args": arguments, "id": call_id}])
+
+        material = " ".join(m.content for m in turn if isinstance(m, ToolMessage))
+        words = (material or "The task is about designing a data model.").split()
+        body = " ".join(words[i % len(words)] for i in range(self.answer_words))
+        return AIMessage(content=f"Based on the material: {body}")
+
+    def _usage(self, messages, message):
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(message.content.split()) + 10 * len(message.tool_calls)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"))
+        time.sleep(self.latency + self.token_latency * len(message.content.split()))
+        message.usage_metadata = self._usage(messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"))
+        await asyncio.sleep(self.latency + self.token_latency * len(message.content.split()))
+        message.usage_metadata = self._usage(messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._respond(messages, kwargs.get("tools"))
+        await asyncio.sleep(self.latency)
+        if message.tool_calls:
+            tool_call_chunks = [
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=tool_call_chunks))
+        else:
+            for i, word in enumerate(message.content.split(" ")):
+                if i:
+                    await asyncio.sleep(self.token_latency)
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, message)))
+
+def fake_task_answer_tool(latency: float = 0.0) -> StructuredTool:
+    # Stands in for the MCP get_task_answer tool when no server is running
+    async def get_task_answer(question: str, step: str, current_document: str) -> str:
+        """Retrieve material answering a question about the current task."""
+        await asyncio.sleep(latency)
+        return (f"Material for '{question}' in {current_document}: a fact table stores measures such as the sales amount, "
+                "dimensions such as date, product and store describe them.")
+
+    return StructuredTool.from_function(coroutine=get_task_answer, name="get_task_answer")
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic offline stand-in for the embedding model.
+
+    Hashed bag-of-words vectors, so texts sharing words are close and retrieval stays meaningful.
+    Every call (one batch or one query) waits `latency` seconds like a network round trip.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            h = stable_hash(word)
+            vector[h % self.dimensions] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
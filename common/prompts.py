@@ -136,13 +136,12 @@ class Prompts:
     - "example": Illustrative examples that clarify the assignment. If none are provided, create a suitable example.
     - "definition": Clear term-definition pairs. Extract or generate these as needed.
     - "instruction": Specific tasks or steps the student must perform. Identify all actionable instructions. If the assignment is vague, break it down into concrete steps.
-    - "table": Any tables of data present in the assignment. Structure them clearly; if none exist, do not fabricate.
 
     Guidelines:
-    - Each chunk should be at least 100 words long, if possible. UNLESS it is a table. One table MUST be whole in one chunk.
-    - Tables are important. Include all values from tables in one chunck
+    - Each chunk should be at least 100 words long, if possible.
+    - Tables have already been extracted from the assignment and are stored separately. Each one is replaced by a line like "[Table 1 with the columns: ...]". Do not create chunks of type "table" and do not copy table values; refer to a table by its number where it helps.
     - Do not omit any sentence from the assignment text; ensure all content is included in at least one chunk.
-    - Use ONLY these types: concept, solution, qa, example, definition, instruction, table
+    - Use ONLY these types: concept, solution, qa, example, definition, instruction
     - If a required chunk type is missing from the assignment, generate it based on your analysis and understanding.
     - The generated chunks will be stored as vectors and used in a Retrieval-Augmented Generation (RAG) system to support the following educational steps: "orientation", "conceptualization", "solution ideation", "planning", and "execution support". Structure and formulate each chunk so that it can be effectively used for these phases, ensuring clarity, completeness, and pedagogical value for each step.
     - Return ONLY a list of JSON objects, one per chunk, in the following format:
@@ -200,6 +199,29 @@ class Prompts:
     Return ONLY the reformulated query. Do not add any explanations or extra content.
     """
 
+    def get_history_summary_prompt(self, previous_summary):
+        return f"""
+    You are summarizing a tutoring conversation between a student and an AI teaching assistant.
+
+    - Update the existing summary with the new messages.
+    - Keep what the student has understood, the questions they asked, the solution attempts they showed and the open problems.
+    - Keep names of tasks, tables, terms and code identifiers exactly as written.
+    - Do not add anything that is not in the conversation.
+    - Be concise, at most a few short paragraphs.
+
+    ---
+
+    Existing summary:
+    {previous_summary or "(empty)"}
+
+    New messages:
+    {self.history}
+
+    ---
+
+    Return ONLY the updated summary.
+    """
+
     def get_student_simulation_prompt(self, last_response):
         return f"""
     You are simulating a motivated, curious student interacting with an AI teaching assistant. Your goal is to understand the task and then try to make a solution.
@@ -0,0 +1,37 @@
+import os
+from common import rate_limit
+from common.config import Config
+
+def get_chat_model(temperature: float | None = None, http_async_client=None, cache=None):
+    if Config.Providers.BACKEND == "fake":
+        from common.fakes import FakeChatModel
+        return FakeChatModel(
+            latency=Config.Providers.FAKE_LLM_LATENCY,
+            token_latency=Config.Providers.FAKE_TOKEN_LATENCY,
+            cache=cache
+        )
+    from langchain_openai import ChatOpenAI
+    # Through the shared rate limiter, which also does the retrying
+    return ChatOpenAI(
+        model=Config.Providers.CHAT_MODEL,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        temperature=temperature,
+        http_client=rate_limit.http_client(),
+        http_async_client=http_async_client or rate_limit.async_http_client(),
+        max_retries=0 if Config.RateLimit.ENABLED else 2,
+        cache=cache
+    )
+
+def get_embeddings():
+    if Config.Providers.BACKEND == "fake":
+        from common.fakes import FakeEmbeddings
+        return FakeEmbeddings(
+            dimensions=Config.Providers.FAKE_EMBEDDING_DIMENSIONS,
+            latency=Config.Providers.FAKE_EMBEDDING_LATENCY
+        )
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(
+        http_client=rate_limit.http_client(),
+        http_async_client=rate_limit.async_http_client(),
+        max_retries=0 if Config.RateLimit.ENABLED else 2
+    )
@@ -0,0 +1,326 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+import httpx
+from common.config import Config
+
+# Priority classes: lower goes first, interactive student turns pre-empt bulk ingestion
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# OpenAI reset hints look like "1s", "6m0s" or "120ms"
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+# Waiting async callers are not woken by releases from other threads, they look again after this long
+ASYNC_POLL_INTERVAL = 0.02
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=INTERACTIVE)
+
+@contextlib.contextmanager
+def priority(level: int):
+    # OpenAI requests made inside the block (or the decorated function) queue with this priority
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def parse_duration(value: str | None) -> float | None:
+    if not value:
+        return None
+    matches = DURATION_PATTERN.findall(value)
+    if matches:
+        return sum(float(number) * DURATION_UNITS[unit] for number, unit in matches)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def retry_after(headers) -> float | None:
+    # Server hints, most specific first: retry-after-ms, retry-after (seconds or HTTP date), the reset of an exhausted limit
+    if "retry-after-ms" in headers:
+        with contextlib.suppress(ValueError):
+            return float(headers["retry-after-ms"]) / 1000
+    if "retry-after" in headers:
+        with contextlib.suppress(ValueError):
+            return float(headers["retry-after"])
+        with contextlib.suppress(TypeError, ValueError):
+            return max(0.0, parsedate_to_datetime(headers["retry-after"]).timestamp() - time.time())
+    resets = [
+        parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+        for kind in ("requests", "tokens")
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+def estimate_tokens(body: bytes) -> int:
+    # Roughly four bytes per prompt token, plus the completion the request allows for
+    tokens = len(body) // 4
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return tokens
+    if "messages" in payload:
+        tokens += payload.get("max_completion_tokens") or payload.get("max_tokens") or Config.RateLimit.COMPLETION_TOKEN_ESTIMATE
+    return tokens
+
+def backoff_delay(attempt: int, hint: float | None = None) -> float:
+    # The server hint plus a little jitter, otherwise full jitter over an exponentially growing window
+    if hint is not None:
+        return min(hint, Config.RateLimit.MAX_DELAY) + random.uniform(0, Config.RateLimit.BASE_DELAY)
+    return random.uniform(0, min(Config.RateLimit.MAX_DELAY, Config.RateLimit.BASE_DELAY * 2 ** attempt))
+
+class RateLimiter:
+    """Process-wide admission control for OpenAI requests.
+
+    Requests wait in one priority queue and leave it in order once the request and token
+    budgets (refilled continuously from the per-minute limits) and the concurrency limit allow.
+    The concurrency limit adapts AIMD-style: it grows by one per window of successful requests
+    and is cut by DECREASE_FACTOR when the API throttles. A retry-after hint pauses everyone.
+    Thread-safe, and usable from any number of event loops.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_concurrency: int | None = None,
+        min_concurrency: int | None = None,
+    ):
+        # Config is read here rather than in the signature, so changes made before the first request apply
+        self.requests_per_minute = requests_per_minute or Config.RateLimit.REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute or Config.RateLimit.TOKENS_PER_MINUTE
+        self.max_concurrency = max_concurrency or Config.RateLimit.MAX_CONCURRENCY
+        self.min_concurrency = min_concurrency or Config.RateLimit.MIN_CONCURRENCY
+        self.concurrency = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.stats = Counter()
+        # Bursts are capped at BURST_SECONDS worth of budget, as the API enforces its limits over short windows too
+        self._request_capacity = max(1.0, self.requests_per_minute * Config.RateLimit.BURST_SECONDS / 60)
+        self._token_capacity = max(1.0, self.tokens_per_minute * Config.RateLimit.BURST_SECONDS / 60)
+        self.request_allowance = self._request_capacity
+        self.token_allowance = self._token_capacity
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._queue: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._refilled
+        self._refilled = now
+        self.request_allowance = min(self._request_capacity, self.request_allowance + elapsed * self.requests_per_minute / 60)
+        self.token_allowance = min(self._token_capacity, self.token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def _try_acquire(self, ticket, tokens) -> float:
+        # 0 when the request may go now, otherwise how long to wait before looking again
+        now = time.monotonic()
+        self._refill(now)
+        if self._queue[0] != ticket:
+            return ASYNC_POLL_INTERVAL
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.concurrency):
+            return ASYNC_POLL_INTERVAL
+        if self.request_allowance < 1:
+            return (1 - self.request_allowance) * 60 / self.requests_per_minute
+        # A request larger than the burst budget goes once the budget is full and leaves it in debt
+        if self.token_allowance < min(tokens, self._token_capacity):
+            return (min(tokens, self._token_capacity) - self.token_allowance) * 60 / self.tokens_per_minute
+        heapq.heappop(self._queue)
+        self.in_flight += 1
+        self.request_allowance -= 1
+        self.token_allowance -= tokens
+        self.stats["requests"] += 1
+        self._condition.notify_all()
+        return 0.0
+
+    def _enqueue(self):
+        ticket = (_priority.get(), next(self._sequence))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _abandon(self, ticket):
+        with self._condition:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+    def _record_wait(self, ticket, started):
+        self.stats[f"wait_seconds_{PRIORITY_NAMES.get(ticket[0], ticket[0])}"] += time.monotonic() - started
+
+    def acquire(self, tokens: int):
+        started = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue()
+            try:
+                while (wait := self._try_acquire(ticket, tokens)) > 0:
+                    self._condition.wait(wait)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+            self._record_wait(ticket, started)
+
+    async def aacquire(self, tokens: int):
+        started = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue()
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_acquire(ticket, tokens)
+                    if wait <= 0:
+                        self._record_wait(ticket, started)
+                        return
+                await asyncio.sleep(min(wait, ASYNC_POLL_INTERVAL))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    def count(self, name: str):
+        with self._condition:
+            self.stats[name] += 1
+
+    def release(self, response: httpx.Response | None = None) -> float | None:
+        # Frees the slot and adapts to the response. Returns None when the outcome is final, otherwise
+        # the server's retry hint in seconds, or -1 for a retryable outcome without one
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            hint = None
+            if response is not None and response.status_code == 429:
+                self.stats["throttled"] += 1
+                hint = retry_after(response.headers)
+                # Concurrent 429s are one congestion signal: cut at most once per interval
+                if now - self._last_decrease > Config.RateLimit.DECREASE_INTERVAL:
+                    self.concurrency = max(self.min_concurrency, self.concurrency * Config.RateLimit.DECREASE_FACTOR)
+                    self._last_decrease = now
+                if hint:
+                    self.paused_until = max(self.paused_until, now + hint)
+            elif response is not None and response.status_code < 400:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self._observe_remaining(response.headers)
+            self._condition.notify_all()
+        if response is not None and response.status_code not in RETRY_STATUS_CODES:
+            return None
+        return hint if hint is not None else -1.0
+
+    def _observe_remaining(self, headers):
+        # The API's own view of what is left wins when it is lower than ours
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        with contextlib.suppress(ValueError):
+            if remaining_requests is not None:
+                self.request_allowance = min(self.request_allowance, float(remaining_requests))
+            if remaining_tokens is not None:
+                self.token_allowance = min(self.token_allowance, float(remaining_tokens))
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            return {"concurrency": round(self.concurrency, 2), "in_flight": self.in_flight, "queued": len(self._queue), **self.stats}
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+def _retry_delay(attempt, hint):
+    # hint: None means final, a negative value means retryable without a server hint
+    if hint is None or attempt >= Config.RateLimit.MAX_RETRIES:
+        return None
+    return backoff_delay(attempt, hint if hint >= 0 else None)
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx transport that queues requests at the shared limiter and retries throttled ones."""
+
+    def __init__(self, transport: httpx.BaseTransport | None = None, limiter: RateLimiter | None = None):
+        self.transport = transport or httpx.HTTPTransport()
+        self.limiter = limiter or get_limiter()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = estimate_tokens(request.read())
+        for attempt in itertools.count():
+            self.limiter.acquire(tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                self.limiter.count("connection_errors")
+                delay = _retry_delay(attempt, self.limiter.release())
+                if delay is None:
+                    raise
+            except BaseException:
+                self.limiter.release()
+                raise
+            else:
+                delay = _retry_delay(attempt, self.limiter.release(response))
+                if delay is None:
+                    return response
+                response.close()
+            self.limiter.count("retries")
+            time.sleep(delay)
+
+    def close(self):
+        self.transport.close()
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of RateLimitedTransport, sharing the same limiter."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None, limiter: RateLimiter | None = None):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.limiter = limiter or get_limiter()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = estimate_tokens(await request.aread())
+        for attempt in itertools.count():
+            await self.limiter.aacquire(tokens)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.limiter.count("connection_errors")
+                delay = _retry_delay(attempt, self.limiter.release())
+                if delay is None:
+                    raise
+            except BaseException:
+                # e.g. cancelled while waiting for the API: the slot is free again
+                self.limiter.release()
+                raise
+            else:
+                delay = _retry_delay(attempt, self.limiter.release(response))
+                if delay is None:
+                    return response
+                await response.aclose()
+            self.limiter.count("retries")
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+def http_client(**kwargs) -> httpx.Client | None:
+    # Clients for the OpenAI SDK; None keeps its default client when the limiter is disabled
+    if not Config.RateLimit.ENABLED:
+        return None
+    return httpx.Client(transport=RateLimitedTransport(httpx.HTTPTransport(limits=kwargs.pop("limits", httpx.Limits()))), **kwargs)
+
+def async_http_client(**kwargs) -> httpx.AsyncClient | None:
+    if not Config.RateLimit.ENABLED:
+        return None
+    return httpx.AsyncClient(transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(limits=kwargs.pop("limits", httpx.Limits()))), **kwargs)
@@ -0,0 +1,149 @@
+import contextlib
+import contextvars
+import json
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from common.config import Config
+
+_current_span = contextvars.ContextVar("trace_span", default=None)
+_lock = threading.Lock()
+# Finished spans of the most recent traces of this process, for the Streamlit debug panel
+_traces: OrderedDict[str, list["Span"]] = OrderedDict()
+_exporter = {"service_name": "gp-mcp", "path": None}
+
+def configure(service_name: str, path: str | None = None):
+    # Spans are always kept in memory; with a path they are also appended there as OTLP JSON lines
+    _exporter["service_name"] = service_name
+    _exporter["path"] = path
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    start: int = field(default_factory=time.time_ns)
+    end: int | None = None
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def duration(self) -> float:
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def parse_traceparent(traceparent: str | None):
+    # W3C trace context: "00-<32 hex trace id>-<16 hex parent span id>-<flags>"
+    parts = (traceparent or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+def current_traceparent() -> str | None:
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+@contextlib.contextmanager
+def span(name: str, parent: str | None = None, **attributes):
+    # Times the block as a child of the current span, or of `parent` (a traceparent) when the context
+    # comes from another event loop or process; without either it starts a new trace
+    if not Config.Tracing.ENABLED:
+        yield Span(name, "", "", None)
+        return
+    trace_id, parent_span_id = parse_traceparent(parent)
+    if trace_id is None:
+        current = _current_span.get()
+        trace_id, parent_span_id = (current.trace_id, current.span_id) if current else (f"{random.getrandbits(128):032x}", None)
+    new_span = Span(name, trace_id, f"{random.getrandbits(64):016x}", parent_span_id, attributes=attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        new_span.end = time.time_ns()
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Closed from another context, e.g. an abandoned async generator finalized by the event loop
+            pass
+        record(new_span)
+
+def record(finished: Span):
+    with _lock:
+        _traces.setdefault(finished.trace_id, []).append(finished)
+        _traces.move_to_end(finished.trace_id)
+        while len(_traces) > Config.Tracing.KEEP_TRACES:
+            _traces.popitem(last=False)
+    if _exporter["path"]:
+        export(finished)
+
+def export(finished: Span):
+    # One OTLP/JSON ExportTraceServiceRequest per line, the format of the OpenTelemetry Collector file exporter
+    line = json.dumps({"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": otlp_value(_exporter["service_name"])}]},
+        "scopeSpans": [{"scope": {"name": "gp-mcp"}, "spans": [finished.to_otlp()]}],
+    }]})
+    try:
+        with _lock, open(_exporter["path"], 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+    except Exception as e:
+        print(f"Error writing trace span: {e}")
+
+def get_trace(trace_id: str) -> list[Span]:
+    with _lock:
+        return sorted(_traces.get(trace_id, []), key=lambda s: s.start)
+
+def summarize_trace(trace_id: str) -> dict:
+    # Total duration of the trace and the time spent per stage (spans of the same name added up)
+    spans = get_trace(trace_id)
+    if not spans:
+        return {"duration": 0.0, "stages": []}
+    stages = defaultdict(lambda: {"count": 0, "seconds": 0.0, "errors": 0})
+    for s in spans:
+        stages[s.name]["count"] += 1
+        stages[s.name]["seconds"] += s.duration
+        stages[s.name]["errors"] += s.error is not None
+    start = min(s.start for s in spans)
+    end = max(s.end or s.start for s in spans)
+    return {
+        "duration": (end - start) / 1e9,
+        "stages": sorted(({"stage": name, **stats} for name, stats in stages.items()), key=lambda stage: -stage["seconds"]),
+    }
@@ -0,0 +1,68 @@
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+from common.config import Config
+
+WORD_PATTERN = re.compile(r"\w+")
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^63 for 31-bit a, b and x
+PRIME = (1 << 31) - 1
+
+def shingles(text: str, size: int | None = None) -> set[int]:
+    size = size or Config.Dedup.SHINGLE_WORDS
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+class NearDuplicateIndex:
+    """MinHash signatures of the kept chunks, bucketed by LSH bands.
+
+    A new chunk is a near-duplicate of a kept chunk if at least `threshold` of its word shingles
+    occur in it. Only kept chunks that share an LSH band with the new chunk are compared, and only
+    those that are retrieved wherever the new chunk would be: chunks of the same file, or shared
+    chunks (the materials, which every task sees).
+    """
+
+    def __init__(self, threshold: float | None = None, num_perm: int | None = None, bands: int | None = None):
+        self.threshold = threshold or Config.Dedup.THRESHOLD
+        num_perm = num_perm or Config.Dedup.NUM_PERM
+        self.bands = bands or Config.Dedup.BANDS
+        if num_perm % self.bands:
+            raise ValueError(f"NUM_PERM ({num_perm}) must be a multiple of BANDS ({self.bands})")
+        # Fixed seed: signatures do not change between runs
+        rng = np.random.default_rng(Config.Dedup.SEED)
+        self._a = rng.integers(1, PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)
+        self._buckets = defaultdict(list)
+        self._kept = []
+
+    def _signature(self, shingle_set):
+        x = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set)) % PRIME
+        return ((self._a[:, None] * x[None, :] + self._b[:, None]) % PRIME).min(axis=1)
+
+    def _bands(self, signature):
+        return [(band, rows.tobytes()) for band, rows in enumerate(np.split(signature, self.bands))]
+
+    def find(self, text: str, owner: str) -> str | None:
+        # Owner of a kept chunk that makes this one redundant, or None
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return None
+        candidates = {i for key in self._bands(self._signature(shingle_set)) for i in self._buckets.get(key, ())}
+        for i in sorted(candidates):
+            kept_shingles, kept_owner, shared = self._kept[i]
+            if (shared or kept_owner == owner) and len(shingle_set & kept_shingles) >= self.threshold * len(shingle_set):
+                return kept_owner
+        return None
+
+    def add(self, text: str, owner: str, shared: bool = False):
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return
+        for key in self._bands(self._signature(shingle_set)):
+            self._buckets[key].append(len(self._kept))
+        self._kept.append((shingle_set, owner, shared))
+
+    def __len__(self):
+        return len(self._kept)
@@ -1,48 +1,140 @@
 import os
 import json
+import hashlib
+import numpy as np
 from docx import Document as DocxDocument
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_chroma import Chroma
-from openai import OpenAI
+from chromadb.api.shared_system_client import SharedSystemClient
+from common import rate_limit
+from common.config import Config
 from common.prompts import Prompts
+from common.providers import get_chat_model, get_embeddings
+from server import metrics
+from server.dedup import NearDuplicateIndex
+from server.snapshot import read_snapshot, write_snapshot
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
 class DocumentProcessor:
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self.embedding_function = OpenAIEmbeddings()
+        self.manifest_path = os.path.join(db_path, "ingestion_manifest.json")
+        self.embedding_function = metrics.InstrumentedEmbeddings(get_embeddings())
         self.db = None
 
-    def load_docx_plain(self, filepath):
+    @staticmethod
+    def _file_checksum(filepath):
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.db_path, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    def _record_file(self, manifest, filepath, ids, duplicates_of=()):
+        manifest[filepath] = {"sha256": self._file_checksum(filepath), "ids": list(ids)}
+        if duplicates_of:
+            # Files whose chunks replaced dropped near-duplicates: if they change, this file is indexed again
+            manifest[filepath]["duplicates_of"] = list(duplicates_of)
+
+    @staticmethod
+    def _with_dependents(manifest, filepaths):
+        # Adds the files that dropped chunks as near-duplicates of chunks of these files, transitively
+        filepaths = set(filepaths)
+        while dependents := {
+            path for path, entry in manifest.items()
+            if path not in filepaths and filepaths & set(entry.get("duplicates_of", []))
+        }:
+            filepaths |= dependents
+        return filepaths
+
+    def dependents(self, filepath):
+        # Files that were indexed without chunks repeating this file's: they are indexed again when it is removed
+        return self._with_dependents(self._load_manifest(), [filepath]) - {filepath}
+
+    @staticmethod
+    def _is_shared(filepath):
+        # Chunks of the materials are retrieved for every task, see get_chunks_for_step
+        return "materials" in filepath
+
+    @staticmethod
+    def _docx_blocks(filepath):
+        # ("paragraph", text) and ("table", rows of cell texts) in document order
         doc = DocxDocument(filepath)
-        full_text = []
         for element in doc.element.body:
             if element.tag.endswith('p'):
                 para = element.xpath(".//w:t")
                 if para:
                     text = ''.join([t.text for t in para if t.text])
-                    full_text.append(text.strip())
+                    yield "paragraph", text.strip()
             elif element.tag.endswith('tbl'):
+                rows = []
                 for row in element.xpath(".//w:tr"):
                     cells = row.xpath(".//w:tc")
-                    row_text = [''.join([t.text for t in cell.xpath(".//w:t") if t.text]).strip() for cell in cells]
-                    full_text.append(' | '.join(row_text))
+                    rows.append([''.join([t.text for t in cell.xpath(".//w:t") if t.text]).strip() for cell in cells])
+                yield "table", rows
+
+    def load_docx_plain(self, filepath):
+        full_text = []
+        for kind, content in self._docx_blocks(filepath):
+            if kind == "paragraph":
+                full_text.append(content)
+            else:
+                full_text.extend(' | '.join(row) for row in content)
         return '\n'.join(full_text)
 
+    def load_docx_prose_and_tables(self, filepath):
+        # The text for the LLM splitter, with a placeholder line where each table was, and the tables
+        prose, tables = [], []
+        for kind, content in self._docx_blocks(filepath):
+            if kind == "paragraph":
+                prose.append(content)
+            elif content:
+                tables.append(content)
+                columns = ', '.join(cell for cell in content[0] if cell)
+                prose.append(f"[Table {len(tables)} with the columns: {columns}]")
+        return '\n'.join(prose), tables
+
+    @staticmethod
+    def table_chunks(tables):
+        # Up to Config.Tables.MAX_ROWS rows per "table" chunk, each repeating the header row
+        chunks = []
+        for number, rows in enumerate(tables, 1):
+            header = ' | '.join(rows[0])
+            body = [' | '.join(row) for row in rows[1:] if any(row)]
+            parts = range(0, len(body), Config.Tables.MAX_ROWS) if body else [0]
+            for start in parts:
+                part = body[start:start + Config.Tables.MAX_ROWS]
+                title = f"Table {number}" if len(parts) == 1 else f"Table {number}, rows {start + 1}-{start + len(part)}"
+                chunks.append({"type": "table", "text": '\n'.join([title, header, *part])})
+        return chunks
+
     def extract_semantic_chunks(self, doc_text):
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        model = get_chat_model(temperature=0)
         prompts = Prompts()
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": prompts.get_chunck_splitter_prompt()},
-                {"role": "user", "content": doc_text}
-            ],
-            temperature=0,
-        )
-        return json.loads(response.choices[0].message.content)
+        response = model.invoke([
+            SystemMessage(content=prompts.get_chunck_splitter_prompt()),
+            HumanMessage(content=doc_text)
+        ])
+        metrics.record_llm_usage("splitter", response)
+        return json.loads(response.content)
+
+    def extract_chunks(self, doc_text, tables):
+        # Tables are chunked by the parser, only the prose goes to the LLM
+        semantic_chunks = self.extract_semantic_chunks(doc_text) if doc_text.strip() else []
+        return semantic_chunks + self.table_chunks(tables)
 
     def chunk_large_items(self, semantic_chunks, doc_id, filepath):
         final_chunks = []
@@ -54,6 +146,38 @@ class DocumentProcessor:
             })
         return final_chunks
 
+    def _near_duplicate_index(self):
+        # The shared chunks already in the index, which can make chunks of any file redundant
+        index = NearDuplicateIndex()
+        if not Config.Dedup.ENABLED or not os.path.exists(self.db_path):
+            return index
+        owners = {chunk_id: path for path, entry in self._load_manifest().items() for chunk_id in entry["ids"]}
+        stored = self.load_existing_db().get(include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+            doc_id = (metadata or {}).get("doc_id", "")
+            if self._is_shared(doc_id):
+                index.add(text, owners.get(chunk_id, doc_id.split(".docx_")[0] + ".docx"), shared=True)
+        return index
+
+    def remove_near_duplicates(self, chunks, filepath, index):
+        # Longest chunks first, so content repeated inside a longer chunk is what gets dropped
+        if not Config.Dedup.ENABLED:
+            return chunks, []
+        dropped, duplicates_of = set(), set()
+        for i in sorted(range(len(chunks)), key=lambda i: -len(chunks[i]["text"])):
+            owner = index.find(chunks[i]["text"], filepath)
+            if owner is None:
+                index.add(chunks[i]["text"], filepath, shared=self._is_shared(filepath))
+                continue
+            dropped.add(i)
+            if owner != filepath:
+                duplicates_of.add(owner)
+        if dropped:
+            words = sum(len(chunks[i]["text"].split()) for i in dropped)
+            print(f"Dropped {len(dropped)} of {len(chunks)} chunks ({words} words) as near-duplicates")
+            metrics.DUPLICATE_CHUNKS.inc(len(dropped))
+        return [chunk for i, chunk in enumerate(chunks) if i not in dropped], sorted(duplicates_of)
+
     def to_langchain_documents(self, chunks):
         return [
             Document(
@@ -62,7 +186,11 @@ class DocumentProcessor:
             ) for chunk in chunks
         ]
 
-    def process_single_file(self, filepath):
+    @metrics.ingestion_job("file")
+    @rate_limit.priority(rate_limit.BULK)
+    def process_single_file(self, filepath, progress=None):
+        # progress(fraction, message) is called as the stages start, e.g. to report them to an MCP client
+        report = progress or (lambda fraction, message: None)
         if not filepath.endswith(".docx"):
             raise ValueError("Only .docx files are supported")
         
@@ -73,14 +201,18 @@ class DocumentProcessor:
         
         doc_id = os.path.splitext(os.path.basename(filepath))[0]
         
-        doc_text = self.load_docx_plain(filepath)
-        print(f"Extracted text length: {len(doc_text)} characters")
+        report(0.0, "Extracting text")
+        doc_text, tables = self.load_docx_prose_and_tables(filepath)
+        print(f"Extracted text length: {len(doc_text)} characters, tables: {len(tables)}")
         
-        semantic_chunks = self.extract_semantic_chunks(doc_text)
+        report(0.1, "Splitting into chunks")
+        semantic_chunks = self.extract_chunks(doc_text, tables)
         print(f"Created semantic chunks: {len(semantic_chunks)}")
         
         final_chunks = self.chunk_large_items(semantic_chunks, doc_id, filepath)
         print(f"Created final chunks: {len(final_chunks)}")
+
+        final_chunks, duplicates_of = self.remove_near_duplicates(final_chunks, filepath, self._near_duplicate_index())
         
         docs = self.to_langchain_documents(final_chunks)
         
@@ -92,13 +224,25 @@ class DocumentProcessor:
             self.db = Chroma(persist_directory=self.db_path, embedding_function=self.embedding_function)
         
         print("Adding documents to database...")
-        self.db.add_documents(docs)
+        report(0.7, f"Embedding and indexing {len(docs)} chunks")
+        ids = self.db.add_documents(docs) if docs else []
+        metrics.INGESTED_CHUNKS.inc(len(docs))
+
+        manifest = self._load_manifest()
+        self._record_file(manifest, filepath, ids, duplicates_of)
+        self._save_manifest(manifest)
         
         self._update_chunks_file(docs)
         
         print(f"File {filepath} successfully processed and added to database")
+        report(1.0, "Done")
         return docs
 
+    def process_files(self, filepaths):
+        # Shared files first, as in process_directory: chunks of the other files may repeat theirs
+        for filepath in sorted(filepaths, key=lambda filepath: not self._is_shared(filepath)):
+            self.process_single_file(filepath)
+
     def _update_chunks_file(self, new_docs):
         try:
             existing_chunks = []
@@ -115,9 +259,9 @@ class DocumentProcessor:
             print(f"Error updating chunks file: {e}")
 
     def remove_file_from_db(self, filepath):
+        # filepath as the manifest keys it, e.g. ./data/tasks/x.docx: files with the same name in other folders stay
         try:
-            file_name = os.path.splitext(os.path.basename(filepath))[0]
-            print(f"Removing file {file_name} from database...")
+            print(f"Removing file {filepath} from database...")
             
             if not os.path.exists(self.db_path):
                 print("Database does not exist")
@@ -125,20 +269,30 @@ class DocumentProcessor:
             
             self.db = Chroma(persist_directory=self.db_path, embedding_function=self.embedding_function)
             
-            all_docs = self.db.get()
-            
-            docs_to_remove = []
-            for i, doc_id in enumerate(all_docs['ids']):
-                if file_name in doc_id:
-                    docs_to_remove.append(doc_id)
+            # Chunks of databases without a manifest entry for the file, found through their doc_id metadata
+            all_docs = self.db.get(include=["metadatas"])
+            docs_to_remove = [
+                chunk_id for chunk_id, metadata in zip(all_docs['ids'], all_docs['metadatas'])
+                if (metadata or {}).get("doc_id", "").startswith(f"{filepath}_")
+            ]
+
+            manifest = self._load_manifest()
+            if filepath in manifest:
+                docs_to_remove.extend(i for i in manifest[filepath]["ids"] if i not in docs_to_remove)
+            removed_chunks = len(docs_to_remove)
+            # Files relying on its chunks lose theirs too, to be indexed again in full (see dependents)
+            for path in self._with_dependents(manifest, [filepath] if filepath in manifest else []):
+                docs_to_remove.extend(i for i in manifest.pop(path)["ids"] if i not in docs_to_remove)
+            self._save_manifest(manifest)
             
             if docs_to_remove:
                 self.db.delete(ids=docs_to_remove)
-                print(f"Removed {len(docs_to_remove)} chunks from database")
+                print(f"Removed {removed_chunks} chunks from database, "
+                      f"{len(docs_to_remove) - removed_chunks} of files to index again")
                 
                 self._remove_from_chunks_file(docs_to_remove)
                 
-                return True, len(docs_to_remove)
+                return True, removed_chunks
             else:
                 print("Documents to remove not found")
                 return True, 0
@@ -171,6 +325,13 @@ class DocumentProcessor:
         except Exception as e:
             print(f"Error removing from chunks file: {e}")
 
+    def indexed_chunks(self, filepath):
+        # Chunk ids of the file if it is in the index and unchanged on disk since, otherwise None
+        entry = self._load_manifest().get(filepath)
+        if entry is None or not os.path.exists(filepath) or entry["sha256"] != self._file_checksum(filepath):
+            return None
+        return entry["ids"]
+
     def get_db_stats(self):
         try:
             if not os.path.exists(self.db_path):
@@ -193,21 +354,39 @@ class DocumentProcessor:
         except Exception as e:
             return {"error": str(e)}
 
+    @metrics.ingestion_job("directory")
+    @rate_limit.priority(rate_limit.BULK)
     def process_directory(self, input_dir):
-        all_docs = []
+        file_chunks = []
         for root, _, files in os.walk(input_dir):
             for filename in files:
                 if filename.endswith(".docx"):
                     filepath = os.path.join(root, filename)
                     doc_id = os.path.splitext(filename)[0]
-                    doc_text = self.load_docx_plain(filepath)
-                    semantic_chunks = self.extract_semantic_chunks(doc_text)
-                    final_chunks = self.chunk_large_items(semantic_chunks, doc_id, filepath)
-                    docs = self.to_langchain_documents(final_chunks)
-                    all_docs.extend(docs)
-                    
+                    doc_text, tables = self.load_docx_prose_and_tables(filepath)
+                    semantic_chunks = self.extract_chunks(doc_text, tables)
+                    file_chunks.append((filepath, self.chunk_large_items(semantic_chunks, doc_id, filepath)))
+
+        # Materials first, so chunks of a task that repeat them can be dropped
+        all_docs = []
+        doc_counts = []
+        index = NearDuplicateIndex()
+        for filepath, final_chunks in sorted(file_chunks, key=lambda item: not self._is_shared(item[0])):
+            final_chunks, duplicates_of = self.remove_near_duplicates(final_chunks, filepath, index)
+            docs = self.to_langchain_documents(final_chunks)
+            all_docs.extend(docs)
+            doc_counts.append((filepath, len(docs), duplicates_of))
+
         self.db = Chroma(persist_directory=self.db_path, embedding_function=self.embedding_function)
-        self.db.add_documents(all_docs)
+        ids = self.db.add_documents(all_docs) if all_docs else []
+        metrics.INGESTED_CHUNKS.inc(len(all_docs))
+
+        manifest = {}
+        offset = 0
+        for filepath, count, duplicates_of in doc_counts:
+            self._record_file(manifest, filepath, ids[offset:offset + count], duplicates_of)
+            offset += count
+        self._save_manifest(manifest)
 
         with open('chuncks.txt', 'w') as f:
             for item in all_docs:
@@ -215,10 +394,21 @@ class DocumentProcessor:
 
         return self.db
 
+    def get_index_version(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        return os.path.getmtime(self.manifest_path)
+
     def load_existing_db(self):
         self.db = Chroma(persist_directory=self.db_path, embedding_function=self.embedding_function)
         return self.db
 
+    def reopen_db(self):
+        # chromadb shares one client per path within a process, whose vector index does not see writes of other
+        # processes: readers start a fresh client to pick up the writer's changes
+        SharedSystemClient.clear_system_cache()
+        return self.load_existing_db()
+
     def get_retriever(self, search_type="mmr", k=6):
         db = self.load_existing_db()
         return db.as_retriever(search_type=search_type, search_kwargs={"k": k})
@@ -245,7 +435,112 @@ class DocumentProcessor:
             print(f"filter {filtered}")
         return filtered
     
-    def initialize_or_load_db(self, input_dir):
+    def export_snapshot(self, snapshot_path):
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"Database not found: {self.db_path}")
+
+        db = self.load_existing_db()
+        data = db.get(include=["embeddings", "documents", "metadatas"])
+        if data["ids"]:
+            embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+        else:
+            embeddings = np.empty((0, 0), dtype=np.float32)
+
+        manifest = self._load_manifest()
+        if not manifest:
+            print("Warning: database has no ingestion manifest, run sync_directory before exporting to enable incremental updates")
+
+        return write_snapshot(snapshot_path, data["ids"], data["documents"], data["metadatas"], embeddings, manifest)
+
+    @metrics.ingestion_job("snapshot_import")
+    def import_snapshot(self, snapshot_path):
+        print(f"Importing snapshot {snapshot_path}...")
+        meta, embeddings = read_snapshot(snapshot_path)
+        ids, texts, metadatas = meta["ids"], meta["documents"], meta["metadatas"]
+
+        self.db = Chroma(persist_directory=self.db_path, embedding_function=self.embedding_function)
+        self.db.reset_collection()
+
+        batch_size = self.db._client.get_max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            self.db._collection.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=texts[start:end],
+                metadatas=metadatas[start:end]
+            )
+
+        self._save_manifest(meta["manifest"])
+
+        with open('chuncks.txt', 'w', encoding='utf-8') as f:
+            for text, metadata in zip(texts, metadatas):
+                f.write(f"{Document(page_content=text, metadata=metadata or {})}\n")
+
+        print(f"Imported {len(ids)} chunks")
+        return len(ids)
+
+    def _bootstrap_manifest(self, input_dir):
+        # Databases created before the manifest existed: map chunks back to files through the doc_id metadata
+        all_docs = self.db.get(include=["metadatas"])
+        manifest = {}
+        for root, _, files in os.walk(input_dir):
+            for filename in files:
+                if filename.endswith(".docx"):
+                    filepath = os.path.join(root, filename)
+                    ids = [
+                        doc_id for doc_id, metadata in zip(all_docs["ids"], all_docs["metadatas"])
+                        if (metadata or {}).get("doc_id", "").startswith(f"{filepath}_")
+                    ]
+                    if ids:
+                        self._record_file(manifest, filepath, ids)
+        return manifest
+
+    @metrics.ingestion_job("sync")
+    @rate_limit.priority(rate_limit.BULK)
+    def sync_directory(self, input_dir):
+        self.load_existing_db()
+        if os.path.exists(self.manifest_path):
+            manifest = self._load_manifest()
+        else:
+            print("No ingestion manifest found. Rebuilding it from the database...")
+            manifest = self._bootstrap_manifest(input_dir)
+
+        current = {}
+        for root, _, files in os.walk(input_dir):
+            for filename in files:
+                if filename.endswith(".docx"):
+                    filepath = os.path.join(root, filename)
+                    current[filepath] = self._file_checksum(filepath)
+
+        changed = [filepath for filepath, entry in manifest.items() if current.get(filepath) != entry["sha256"]]
+        stale = self._with_dependents(manifest, changed)
+        removed = 0
+        for filepath, entry in list(manifest.items()):
+            if filepath in stale:
+                print(f"Removing outdated chunks of {filepath}...")
+                if entry["ids"]:
+                    self.db.delete(ids=entry["ids"])
+                    self._remove_from_chunks_file(entry["ids"])
+                del manifest[filepath]
+                if filepath not in current:
+                    removed += 1
+        self._save_manifest(manifest)
+
+        added = 0
+        for filepath in sorted(current, key=lambda filepath: not self._is_shared(filepath)):
+            if filepath not in manifest:
+                self.process_single_file(filepath)
+                added += 1
+
+        return added, removed
+
+    def initialize_or_load_db(self, input_dir, snapshot_path=None):
+        if not os.path.exists(self.db_path) and snapshot_path and os.path.exists(snapshot_path):
+            print("No existing DB found. Booting from snapshot...")
+            self.import_snapshot(snapshot_path)
+            self.sync_directory(input_dir)
+            return self.load_existing_db()
         if not os.path.exists(self.db_path):
             print("No existing DB found. Creating new one...")
             return self.process_directory(input_dir)
@@ -0,0 +1,123 @@
+import contextlib
+import threading
+import time
+from langchain_core.embeddings import Embeddings
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from common.config import Config
+
+KNOWN_STEPS = {"orientation", "conceptualization", "execution support"}
+OTHER_LABEL = "other"
+
+TOOL_REQUESTS = Counter("mcp_tool_requests_total", "MCP tool calls", ["tool", "status"])
+TOOL_IN_FLIGHT = Gauge("mcp_tool_in_flight", "MCP tool calls being answered", ["tool"], multiprocess_mode="livesum")
+TOOL_DURATION = Histogram("mcp_tool_duration_seconds", "Duration of MCP tool calls", ["tool"])
+ANSWER_REQUESTS = Counter("get_task_answer_requests_total", "get_task_answer calls per document and step", ["document", "step"])
+ANSWER_DURATION = Histogram("get_task_answer_duration_seconds", "Duration of get_task_answer per step", ["step"])
+ANSWER_COMPUTATIONS = Counter("get_task_answer_computations_total", "get_task_answer retrievals and chain calls actually run")
+ANSWER_COALESCED = Counter("get_task_answer_coalesced_total", "get_task_answer calls that shared an identical call already in progress")
+RETRIEVAL_DURATION = Histogram("retrieval_duration_seconds", "Vector search and filtering of get_task_answer")
+RETRIEVED_CHUNKS = Histogram("retrieval_chunks", "Chunks passed to the answer chain", buckets=(0, 1, 2, 4, 6, 8, 12, 20))
+CHAIN_DURATION = Histogram("chain_duration_seconds", "Answer chain (LLM) call of get_task_answer")
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens used by the server", ["stage", "kind"])
+LLM_COST = Counter("llm_cost_usd_total", "Estimated LLM cost from Config.Metrics prices", ["stage"])
+EMBEDDING_CALLS = Counter("embedding_calls_total", "Embedding model calls", ["operation"])
+EMBEDDING_TEXTS = Counter("embedding_texts_total", "Texts sent to the embedding model", ["operation"])
+INGESTION_JOBS = Counter("ingestion_jobs_total", "Ingestion jobs", ["kind", "status"])
+INGESTION_DURATION = Histogram("ingestion_job_duration_seconds", "Duration of ingestion jobs", ["kind"],
+                               buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+INGESTED_CHUNKS = Counter("ingestion_chunks_total", "Chunks added to the index")
+DUPLICATE_CHUNKS = Counter("ingestion_duplicate_chunks_total", "Near-duplicate chunks dropped before indexing")
+
+_documents = set()
+_documents_lock = threading.Lock()
+
+def step_label(step):
+    return step if step in KNOWN_STEPS else OTHER_LABEL
+
+def document_label(document):
+    # The document comes from the model's tool call: keep the label set bounded
+    with _documents_lock:
+        if document in _documents:
+            return document
+        if len(_documents) < Config.Metrics.MAX_DOCUMENT_LABELS:
+            _documents.add(document)
+            return document
+    return OTHER_LABEL
+
+@contextlib.contextmanager
+def tool_call(tool):
+    # Yields the outcome, whose "status" the tool may change (e.g. to "warming", kept when it then raises)
+    TOOL_IN_FLIGHT.labels(tool).inc()
+    start = time.perf_counter()
+    outcome = {"status": "ok"}
+    try:
+        yield outcome
+    except BaseException:
+        if outcome["status"] == "ok":
+            outcome["status"] = "error"
+        raise
+    finally:
+        TOOL_IN_FLIGHT.labels(tool).dec()
+        TOOL_DURATION.labels(tool).observe(time.perf_counter() - start)
+        TOOL_REQUESTS.labels(tool, outcome["status"]).inc()
+
+@contextlib.contextmanager
+def ingestion_job(kind):
+    # Also usable as a decorator of the DocumentProcessor ingestion methods
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        INGESTION_JOBS.labels(kind, "error").inc()
+        raise
+    else:
+        INGESTION_JOBS.labels(kind, "ok").inc()
+    finally:
+        INGESTION_DURATION.labels(kind).observe(time.perf_counter() - start)
+
+def record_llm_usage(stage, response):
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return
+    prompt_tokens, completion_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    LLM_TOKENS.labels(stage, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(stage, "completion").inc(completion_tokens)
+    LLM_COST.labels(stage).inc(
+        (prompt_tokens * Config.Metrics.PROMPT_PRICE_PER_MILLION + completion_tokens * Config.Metrics.COMPLETION_PRICE_PER_MILLION) / 1e6
+    )
+
+class InstrumentedEmbeddings(Embeddings):
+    """Embedding model wrapper that counts calls and texts for /metrics."""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    @staticmethod
+    def _count(operation, texts):
+        EMBEDDING_CALLS.labels(operation).inc()
+        EMBEDDING_TEXTS.labels(operation).inc(texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self._count("documents", len(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        self._count("query", 1)
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self._count("documents", len(texts))
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        self._count("query", 1)
+        return await self.embeddings.aembed_query(text)
+
+def render(multiprocess_dir: str | None = None) -> tuple[bytes, str]:
+    # Prometheus text format; with a directory, the sum over all worker processes writing to it
+    if multiprocess_dir is None:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=multiprocess_dir)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,18 +1,38 @@
-from mcp.server.fastmcp import FastMCP
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.server.fastmcp import Context, FastMCP
+from mcp.types import TextContent, ToolAnnotations
+from common import tracing
 from common.config import Config
+from common.providers import get_chat_model
+from server import metrics
 from server.document_processor import DocumentProcessor
-from langchain_openai import ChatOpenAI
+from server.single_flight import SingleFlight
 from langchain_core.prompts import ChatPromptTemplate
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
 from dotenv import load_dotenv
+import base64
+from typing import Any
+import threading
+import time
+import anyio
+import httpx
 import os
 
 load_dotenv(override=True)
 
-processor = DocumentProcessor(db_path="./teaching_chroma_db")
-db = processor.initialize_or_load_db(input_dir="./data") 
-retriever = db.as_retriever(search_type="mmr", search_kwargs={"k": 4})
+# In multi-worker mode (server.workers) one writer builds the index and readers only load it
+SERVER_ROLE = os.getenv("MCP_SERVER_ROLE", "writer")
+WRITER_URL = os.getenv("MCP_WRITER_URL")
+
+INDEX_WARMING_MESSAGE = "The teaching materials are still being indexed. Please try again in a few moments."
+DATA_DIR = "./data"
+UPLOAD_FOLDERS = ("tasks", "materials")
+# Tools that change the index; clients keep them away from the model (see chat_client/tools.py)
+INDEX_TOOL_ANNOTATIONS = ToolAnnotations(readOnlyHint=False, destructiveHint=False, idempotentHint=True)
 
-model = ChatOpenAI(model='gpt-4.1-mini', api_key=os.getenv("OPENAI_API_KEY"))
 template = """
 Here are some relevant data related to the question (data): {data}
 
@@ -20,21 +40,256 @@ Here is the question to answer: {question}
 
 Give the answer based only on the information you found in the data
 """
-prompt = ChatPromptTemplate.from_template(template)
-chain = prompt | model
 
-mcp = FastMCP("Teaching AI")
+# Built in the background by initialize_index so the server can bind its port immediately
+processor = None
+retriever = None
+chain = None
+index_ready = threading.Event()
+index_error = None
+index_version = None
+# In-progress get_task_answer computations by normalized arguments
+answer_flights = SingleFlight()
+# This process is the only writer of the index and ./data; uploads and removals are applied one at a time
+index_write_lock = threading.Lock()
+
+def build_chain():
+    model = get_chat_model()
+    prompt = ChatPromptTemplate.from_template(template)
+    return prompt | model
+
+def build_retriever(db):
+    search_kwargs = {"k": Config.Server.SEARCH_K}
+    if Config.Server.SEARCH_TYPE == "mmr":
+        search_kwargs.update(fetch_k=Config.Server.SEARCH_FETCH_K, lambda_mult=Config.Server.SEARCH_LAMBDA_MULT)
+    return db.as_retriever(search_type=Config.Server.SEARCH_TYPE, search_kwargs=search_kwargs)
+
+def wait_for_writer():
+    while True:
+        if WRITER_URL:
+            try:
+                if httpx.get(f"{WRITER_URL}{Config.Server.READY_PATH}", timeout=5).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+        elif os.path.exists(processor.db_path):
+            return
+        print("Waiting for the writer to build the index...")
+        time.sleep(1)
+
+def initialize_index():
+    global processor, retriever, chain, index_error, index_version
+    try:
+        processor = DocumentProcessor(db_path="./teaching_chroma_db")
+        if SERVER_ROLE == "reader":
+            wait_for_writer()
+            db = processor.load_existing_db()
+        else:
+            db = processor.initialize_or_load_db(input_dir="./data", snapshot_path=Config.Server.SNAPSHOT_PATH)
+        index_version = processor.get_index_version()
+        retriever = build_retriever(db)
+        chain = build_chain()
+        index_ready.set()
+        print("Index is ready")
+    except Exception as e:
+        index_error = str(e)
+        print(f"Error initializing index: {e}")
+
+def start_index_initialization():
+    thread = threading.Thread(target=initialize_index, name="index-init", daemon=True)
+    thread.start()
+    return thread
+
+mcp = FastMCP(
+    "Teaching AI",
+    host=os.getenv("MCP_SERVER_HOST", "127.0.0.1"),
+    port=int(os.getenv("MCP_SERVER_PORT", Config.Server.PORT)),
+    sse_path=Config.Server.SSE_PATH,
+    streamable_http_path=Config.Server.STREAMABLE_HTTP_PATH,
+    stateless_http=Config.Server.STATELESS_HTTP,
+    json_response=Config.Server.JSON_RESPONSE,
+)
+
+@mcp.custom_route(Config.Server.HEALTH_PATH, methods=["GET"])
+async def liveness(request: Request) -> JSONResponse:
+    return JSONResponse({"status": "ok"})
+
+@mcp.custom_route(Config.Server.READY_PATH, methods=["GET"])
+async def readiness(request: Request) -> JSONResponse:
+    if index_ready.is_set():
+        return JSONResponse({"status": "ready"})
+    if index_error:
+        return JSONResponse({"status": "error", "error": index_error}, status_code=503)
+    return JSONResponse({"status": "warming"}, status_code=503)
+
+@mcp.custom_route(Config.Server.METRICS_PATH, methods=["GET"])
+async def prometheus_metrics(request: Request) -> Response:
+    # Under server.workers all workers write to PROMETHEUS_MULTIPROC_DIR and are reported together
+    body, content_type = metrics.render(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+    return Response(body, media_type=content_type)
+
+def refresh_index_if_changed():
+    global retriever, index_version
+    version = processor.get_index_version()
+    if version != index_version:
+        print("Index changed on disk. Reloading...")
+        # The writer's own client already has its changes
+        retriever = build_retriever(processor.reopen_db() if SERVER_ROLE == "reader" else processor.load_existing_db())
+        index_version = version
+
+def answer_question(question, step, current_document):
+    if SERVER_ROLE == "reader":
+        with tracing.span("server.refresh_index"):
+            refresh_index_if_changed()
+    with tracing.span("server.retrieval", search_type=Config.Server.SEARCH_TYPE) as retrieval_span, metrics.RETRIEVAL_DURATION.time():
+        if step:
+            chunks = processor.get_chunks_for_step(step, retriever, question, current_document)
+            data = [doc.page_content for doc in chunks]
+        else:
+            data = retriever.invoke(question)
+        retrieval_span.set(chunks=len(data))
+    metrics.RETRIEVED_CHUNKS.observe(len(data))
+    with tracing.span("server.chain") as chain_span, metrics.CHAIN_DURATION.time():
+        response = chain.invoke({"data": data, "question": question})
+        metrics.record_llm_usage("chain", response)
+        if response.usage_metadata:
+            chain_span.set(tokens=response.usage_metadata.get("total_tokens", 0))
+    return response.content
+
+def answer_key(question, step, current_document):
+    # Calls differing only in case, whitespace or trailing punctuation get the same answer
+    return " ".join(question.lower().split()).rstrip("?!. "), step, current_document
+
+def request_traceparent():
+    # Trace context the chat client sends in the _meta of the tool call
+    try:
+        meta = mcp.get_context().request_context.meta
+    except ValueError:
+        return None
+    return getattr(meta, "traceparent", None) if meta else None
 
 @mcp.tool()
-def get_task_answer(question: str, step: str, current_document: str) -> str:
+async def get_task_answer(question: str, step: str, current_document: str) -> str:
     print(f"question {question}")
-    if step:
-        chunks = processor.get_chunks_for_step(step, retriever, question, current_document)
-        data = [doc.page_content for doc in chunks]
+    metrics.ANSWER_REQUESTS.labels(metrics.document_label(current_document), metrics.step_label(step)).inc()
+    with (
+        tracing.span("server.get_task_answer", parent=request_traceparent(), step=step, document=current_document) as answer_span,
+        metrics.tool_call("get_task_answer") as outcome,
+        metrics.ANSWER_DURATION.labels(metrics.step_label(step)).time(),
+    ):
+        if not index_ready.is_set():
+            answer_span.set(warming=True)
+            outcome["status"] = "warming"
+            return INDEX_WARMING_MESSAGE
+        # Retrieval and the chain are blocking, keep them off the event loop serving the other sessions
+        compute = lambda: anyio.to_thread.run_sync(answer_question, question, step, current_document)
+        if not Config.Server.COALESCE_REQUESTS:
+            metrics.ANSWER_COMPUTATIONS.inc()
+            return await compute()
+        key = answer_key(question, step, current_document)
+        coalesced = key in answer_flights
+        (metrics.ANSWER_COALESCED if coalesced else metrics.ANSWER_COMPUTATIONS).inc()
+        answer_span.set(coalesced=coalesced)
+        return await answer_flights.run(key, compute)
+
+def upload_path(filename, folder):
+    if folder not in UPLOAD_FOLDERS:
+        raise ValueError(f"Unknown folder {folder!r}, expected one of {', '.join(UPLOAD_FOLDERS)}")
+    if os.path.basename(filename) != filename or not filename.endswith(".docx"):
+        raise ValueError("Only .docx file names without a directory are supported")
+    # Same form as the paths os.walk yields during sync_directory, which key the ingestion manifest
+    return os.path.join(DATA_DIR, folder, filename)
+
+def ingest_file(filepath, content, progress):
+    with index_write_lock:
+        if os.path.exists(filepath):
+            ids = processor.indexed_chunks(filepath)
+            with open(filepath, "rb") as f:
+                unchanged = f.read() == content
+            # A repeated upload (e.g. a client retry after a dropped connection) is not an error
+            if ids is not None and unchanged:
+                return {"document": filepath, "chunks": len(ids), "already_indexed": True}
+            raise ValueError(f"File {os.path.basename(filepath)} already exists")
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, "wb") as f:
+            f.write(content)
+        try:
+            docs = processor.process_single_file(filepath, progress=progress)
+        except Exception:
+            os.remove(filepath)
+            raise
+        refresh_index_if_changed()
+        return {"document": filepath, "chunks": len(docs), "already_indexed": False}
+
+def remove_file(filepath):
+    with index_write_lock:
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"File not found: {os.path.basename(filepath)}")
+        dependents = processor.dependents(filepath)
+        success, result = processor.remove_file_from_db(filepath)
+        if not success:
+            raise RuntimeError(result)
+        os.remove(filepath)
+        # Indexes again the files whose near-duplicate chunks were dropped in favour of the removed file's
+        processor.process_files([path for path in dependents if os.path.exists(path)])
+        refresh_index_if_changed()
+        return {"document": filepath, "removed_chunks": result}
+
+async def call_writer(ctx, name, arguments):
+    # Readers only open the index for reading: index changes are made by the writer, whose progress is passed on
+    if not WRITER_URL:
+        raise RuntimeError("This server is a read-only replica; send index changes to the writer")
+    transport = os.getenv("MCP_TRANSPORT", Config.Server.TRANSPORT)
+    if transport == "streamable-http":
+        connection = streamablehttp_client(f"{WRITER_URL}{Config.Server.STREAMABLE_HTTP_PATH}")
     else:
-        data = retriever.invoke(question)
-    result = chain.invoke({"data": data, "question": question}).content
-    return result
+        connection = sse_client(f"{WRITER_URL}{Config.Server.SSE_PATH}")
+    async with connection as (read_stream, write_stream, *_):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            result = await session.call_tool(name, arguments, progress_callback=ctx.report_progress)
+    if result.isError:
+        message = " ".join(content.text for content in result.content if isinstance(content, TextContent))
+        # FastMCP adds this prefix to the error again when it is raised here
+        raise RuntimeError(message.removeprefix(f"Error executing tool {name}: "))
+    return result.structuredContent
+
+def thread_progress(ctx):
+    # For work running in a worker thread: sends the stage to the client as an MCP progress notification
+    return lambda fraction, message: anyio.from_thread.run(ctx.report_progress, fraction, 1.0, message)
+
+@mcp.tool(annotations=INDEX_TOOL_ANNOTATIONS)
+async def ingest_document(filename: str, folder: str, content_base64: str, ctx: Context) -> dict[str, Any]:
+    """Store an uploaded .docx file in the tasks or materials folder and add it to the index."""
+    with (
+        tracing.span("server.ingest_document", parent=request_traceparent(), document=filename, folder=folder),
+        metrics.tool_call("ingest_document") as outcome,
+    ):
+        if SERVER_ROLE == "reader":
+            return await call_writer(ctx, "ingest_document", {"filename": filename, "folder": folder, "content_base64": content_base64})
+        if not index_ready.is_set():
+            outcome["status"] = "warming"
+            raise RuntimeError(INDEX_WARMING_MESSAGE)
+        filepath = upload_path(filename, folder)
+        content = base64.b64decode(content_base64, validate=True)
+        await ctx.report_progress(0.0, 1.0, "Queued for indexing")
+        return await anyio.to_thread.run_sync(ingest_file, filepath, content, thread_progress(ctx))
+
+@mcp.tool(annotations=INDEX_TOOL_ANNOTATIONS)
+async def remove_document(filename: str, folder: str, ctx: Context) -> dict[str, Any]:
+    """Remove a .docx file of the tasks or materials folder and its chunks from the index."""
+    with (
+        tracing.span("server.remove_document", parent=request_traceparent(), document=filename, folder=folder),
+        metrics.tool_call("remove_document") as outcome,
+    ):
+        if SERVER_ROLE == "reader":
+            return await call_writer(ctx, "remove_document", {"filename": filename, "folder": folder})
+        if not index_ready.is_set():
+            outcome["status"] = "warming"
+            raise RuntimeError(INDEX_WARMING_MESSAGE)
+        return await anyio.to_thread.run_sync(remove_file, upload_path(filename, folder))
 
 if __name__ == "__main__":
-    mcp.run(transport=Config.Server.TRANSPORT)
+    tracing.configure("gp-mcp-server", Config.Tracing.SERVER_PATH)
+    start_index_initialization()
+    mcp.run(transport=os.getenv("MCP_TRANSPORT", Config.Server.TRANSPORT))
@@ -0,0 +1,50 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one computation.
+
+    The first caller starts the computation as its own task, later callers with the same key
+    await that task while it runs. Every caller gets the result or the exception. A cancelled caller
+    only stops waiting; the computation is cancelled once no caller waits for it anymore.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[Hashable, int] = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            del self._waiters[key]
+        # Mark the exception as retrieved in case every caller was cancelled before it was raised
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable]):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._tasks[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done: self._done(key, done))
+        self._waiters[key] += 1
+        try:
+            # shield: cancelling one caller must not cancel the computation the others wait for
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._tasks.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    # Forget it right away, so a new caller starts afresh instead of joining a cancelled task
+                    del self._tasks[key]
+                    del self._waiters[key]
+                    task.cancel()
+            raise
@@ -0,0 +1,107 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+
+# Snapshot file layout:
+#   fixed header | JSON metadata (ids, documents, metadatas, manifest) | padding | float32 embeddings (count x dim)
+# The embeddings block starts on an aligned offset so it can be memory-mapped directly.
+# The checksum is a sha256 over the JSON metadata followed by the embeddings block.
+SNAPSHOT_MAGIC = b"GPMCPIDX"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<8sIIQQQ32s")
+SNAPSHOT_ALIGNMENT = 64
+CHECKSUM_BLOCK_SIZE = 1 << 20
+
+def _aligned(offset):
+    return (offset + SNAPSHOT_ALIGNMENT - 1) // SNAPSHOT_ALIGNMENT * SNAPSHOT_ALIGNMENT
+
+def _update_checksum(digest, data):
+    view = memoryview(data).cast("B")
+    for start in range(0, len(view), CHECKSUM_BLOCK_SIZE):
+        digest.update(view[start:start + CHECKSUM_BLOCK_SIZE])
+
+def write_snapshot(path, ids, documents, metadatas, embeddings, manifest):
+    embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+    if embeddings.ndim != 2 or embeddings.shape[0] != len(ids):
+        raise ValueError("Embeddings must be a matrix with one row per chunk")
+    count, dim = embeddings.shape
+
+    meta = json.dumps({
+        "ids": list(ids),
+        "documents": list(documents),
+        "metadatas": list(metadatas),
+        "manifest": manifest,
+    }, ensure_ascii=False).encode("utf-8")
+    data_offset = _aligned(SNAPSHOT_HEADER.size + len(meta))
+
+    digest = hashlib.sha256()
+    digest.update(meta)
+    _update_checksum(digest, embeddings)
+
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, dim, count, len(meta), data_offset, digest.digest())
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(meta)
+        f.write(b"\0" * (data_offset - SNAPSHOT_HEADER.size - len(meta)))
+        f.write(embeddings.tobytes())
+    os.replace(tmp_path, path)
+    return count
+
+def read_snapshot(path, verify=True):
+    with open(path, "rb") as f:
+        header = f.read(SNAPSHOT_HEADER.size)
+        if len(header) != SNAPSHOT_HEADER.size:
+            raise ValueError(f"Not a snapshot file: {path}")
+        magic, version, dim, count, meta_len, data_offset, checksum = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a snapshot file: {path}")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        meta_bytes = f.read(meta_len)
+
+    if count:
+        embeddings = np.memmap(path, dtype="<f4", mode="r", offset=data_offset, shape=(count, dim))
+    else:
+        embeddings = np.empty((0, dim), dtype="<f4")
+
+    if verify:
+        digest = hashlib.sha256()
+        digest.update(meta_bytes)
+        _update_checksum(digest, embeddings)
+        if digest.digest() != checksum:
+            raise ValueError(f"Snapshot checksum mismatch: {path}")
+
+    meta = json.loads(meta_bytes.decode("utf-8"))
+    if len(meta["ids"]) != count:
+        raise ValueError(f"Snapshot is corrupted: {path}")
+    return meta, embeddings
+
+def main():
+    from server.document_processor import DocumentProcessor
+
+    parser = argparse.ArgumentParser(description="Export or import a portable index snapshot")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("snapshot_path")
+    parser.add_argument("--db-path", default="./teaching_chroma_db")
+    parser.add_argument("--input-dir", default="./data", help="Directory to sync incrementally after import")
+    parser.add_argument("--no-sync", action="store_true", help="Do not apply incremental changes after import")
+    args = parser.parse_args()
+
+    processor = DocumentProcessor(db_path=args.db_path)
+    if args.command == "export":
+        count = processor.export_snapshot(args.snapshot_path)
+        print(f"Exported {count} chunks to {args.snapshot_path}")
+    else:
+        count = processor.import_snapshot(args.snapshot_path)
+        print(f"Imported {count} chunks from {args.snapshot_path}")
+        if not args.no_sync:
+            added, removed = processor.sync_directory(args.input_dir)
+            print(f"Synced {args.input_dir}: {added} files added or updated, {removed} files removed")
+
+if __name__ == "__main__":
+    main()
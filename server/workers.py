@@ -0,0 +1,217 @@
+import argparse
+import contextlib
+import itertools
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import httpx
+import uvicorn
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+from prometheus_client import multiprocess
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from common.config import Config
+
+# The SSE "endpoint" event carries the session id the client will post its messages with
+SESSION_ID_PATTERN = re.compile(rb"session_id=([0-9a-f]+)")
+# Streamable HTTP returns the session id in a header and expects it back on every request
+MCP_SESSION_ID_HEADER = "mcp-session-id"
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host", "content-length",
+}
+
+class Worker:
+    def __init__(self, index, port, role):
+        self.index = index
+        self.port = port
+        self.role = role
+        self.url = f"http://127.0.0.1:{port}"
+        self.active_sessions = 0
+        self.process = None
+
+    def start(self, writer_url):
+        env = dict(
+            os.environ,
+            MCP_SERVER_HOST="127.0.0.1",
+            MCP_SERVER_PORT=str(self.port),
+            MCP_SERVER_ROLE=self.role,
+            MCP_WRITER_URL=writer_url,
+        )
+        self.process = subprocess.Popen([sys.executable, "-m", "server.server"], env=env)
+        print(f"Started {self.role} worker {self.index} on port {self.port} (pid {self.process.pid})")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            # Drops the in-flight gauge of the stopped process from the sum
+            multiprocess.mark_process_dead(self.process.pid)
+
+class StickyProxy:
+    def __init__(self, workers):
+        self.workers = workers
+        self.sessions = {}
+        self.rotation = itertools.count()
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=5.0),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+        )
+        self.app = Starlette(
+            routes=[Route("/{path:path}", self.handle, methods=["GET", "POST", "DELETE"])],
+            lifespan=self.lifespan,
+        )
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app):
+        yield
+        await self.client.aclose()
+
+    def pick_worker(self):
+        # Least sessions first, ties are rotated so stateless requests spread across all workers
+        offset = next(self.rotation) % len(self.workers)
+        rotated = self.workers[offset:] + self.workers[:offset]
+        return min(rotated, key=lambda worker: worker.active_sessions)
+
+    def register_session(self, session_id, worker):
+        self.sessions[session_id] = worker
+        worker.active_sessions += 1
+
+    def unregister_session(self, session_id):
+        worker = self.sessions.pop(session_id, None)
+        if worker is not None:
+            worker.active_sessions -= 1
+
+    async def proxy(self, request, worker, sniff_session=False):
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+        upstream_request = self.client.build_request(
+            request.method,
+            f"{worker.url}{request.url.path}",
+            params=request.query_params,
+            headers=headers,
+            content=await request.body(),
+        )
+        upstream = await self.client.send(upstream_request, stream=True)
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+        if not sniff_session:
+            return StreamingResponse(
+                upstream.aiter_raw(),
+                status_code=upstream.status_code,
+                headers=response_headers,
+                background=BackgroundTask(upstream.aclose),
+            )
+
+        async def stream():
+            session_id = None
+            buffer = b""
+            try:
+                async for chunk in upstream.aiter_raw():
+                    if session_id is None:
+                        buffer += chunk
+                        match = SESSION_ID_PATTERN.search(buffer)
+                        if match:
+                            session_id = match.group(1).decode()
+                            self.register_session(session_id, worker)
+                            buffer = b""
+                    yield chunk
+            finally:
+                if session_id is not None:
+                    self.unregister_session(session_id)
+                await upstream.aclose()
+
+        return StreamingResponse(stream(), status_code=upstream.status_code, headers=response_headers)
+
+    async def readiness(self):
+        statuses = {}
+        for worker in self.workers:
+            try:
+                response = await self.client.get(f"{worker.url}{Config.Server.READY_PATH}", timeout=5)
+                statuses[worker.index] = response.json().get("status")
+            except (httpx.HTTPError, ValueError):
+                statuses[worker.index] = "unreachable"
+        ready = all(status == "ready" for status in statuses.values())
+        return JSONResponse(
+            {"status": "ready" if ready else "warming", "workers": statuses},
+            status_code=200 if ready else 503,
+        )
+
+    def metrics(self):
+        # The workers write their metrics to PROMETHEUS_MULTIPROC_DIR, reported here as one sum
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+    async def handle(self, request: Request) -> Response:
+        path = request.url.path
+        if path == Config.Server.HEALTH_PATH:
+            return JSONResponse({"status": "ok"})
+        if path == Config.Server.READY_PATH:
+            return await self.readiness()
+        if path == Config.Server.METRICS_PATH:
+            return self.metrics()
+
+        session_id = request.query_params.get("session_id") or request.headers.get(MCP_SESSION_ID_HEADER)
+        if session_id:
+            worker = self.sessions.get(session_id)
+            if worker is None:
+                return Response("Could not find session", status_code=404)
+            response = await self.proxy(request, worker)
+            if request.method == "DELETE" or response.status_code == 404:
+                self.unregister_session(session_id)
+            return response
+
+        if request.method == "GET" and path == Config.Server.SSE_PATH:
+            return await self.proxy(request, self.pick_worker(), sniff_session=True)
+
+        if path == Config.Server.STREAMABLE_HTTP_PATH:
+            worker = self.pick_worker()
+            response = await self.proxy(request, worker)
+            new_session_id = response.headers.get(MCP_SESSION_ID_HEADER)
+            if new_session_id:
+                self.register_session(new_session_id, worker)
+            return response
+
+        return await self.proxy(request, self.pick_worker())
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several MCP server processes behind a sticky-session proxy")
+    parser.add_argument("--workers", type=int, default=Config.Server.WORKERS)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=Config.Server.PORT)
+    args = parser.parse_args()
+
+    # Worker 0 is the single writer: it builds or syncs the index, the others open it read-only
+    workers = [
+        Worker(i, args.port + 1 + i, "writer" if i == 0 else "reader")
+        for i in range(max(args.workers, 1))
+    ]
+    writer_url = workers[0].url
+    # Inherited by the workers, so prometheus_client keeps their metrics in files the proxy can add up
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="mcp_metrics_")
+    for worker in workers:
+        worker.start(writer_url)
+
+    proxy = StickyProxy(workers)
+    # uvicorn re-raises SIGTERM after its shutdown: exit through the finally below instead of being killed by it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        uvicorn.run(proxy.app, host=args.host, port=args.port)
+    finally:
+        for worker in workers:
+            worker.stop()
+        shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+
+if __name__ == "__main__":
+    main()